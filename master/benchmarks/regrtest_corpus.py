@@ -0,0 +1,483 @@
+"""Benchmark regrtest log analysis on a synthetic corpus
+
+Generates regrtest output like the buildbots' (refleak runs, many failures,
+verbose re-runs of the failed tests, stderr interleaved with stdout), as
+the content of a Buildbot stdio log: each line starts with "o" (stdout)
+or "e" (stderr). The logs are written to files of about the requested
+sizes (in --corpus-dir, where they are kept for the next runs), then
+analyzed with each method of custom.testsuite_utils.Logs, with
+get_logs_and_tracebacks_from_build, and with
+stream_logs_and_tracebacks_from_build (reading the file in chunks, as
+from the data API).
+
+Throughput is measured first (the best of a few runs); then the memory
+peak of each analysis is measured separately, since tracing allocations
+slows everything down.
+The peak doesn't count the log itself, which is in memory beforehand
+(except for the streamed analysis, which reads it in chunks).
+
+With --compare, the results are checked against a previous --json output:
+the check fails if any throughput dropped, or any memory peak grew, by
+more than --tolerance.
+
+Run from the repository root:
+
+    venv/bin/python master/benchmarks/regrtest_corpus.py --help
+"""
+
+import argparse
+import itertools
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from twisted.internet import defer, task
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom import testsuite_utils  # noqa: E402
+from custom.testsuite_utils import Logs  # noqa: E402
+
+TESTS_PER_RUN = 480
+
+# Analyses are timed up to --repeat times (keeping the best time), but not
+# repeated once they took REPEAT_SECONDS in total
+REPEAT_SECONDS = 5
+
+SYLLABLES = [
+    'ast', 'asyncio', 'bytes', 'capi', 'codecs', 'dict', 'email', 'enum',
+    'float', 'gc', 'io', 'json', 'list', 'locale', 'os', 'pickle', 're',
+    'set', 'socket', 'sqlite3', 'ssl', 'str', 'sys', 'thread', 'time',
+    'typing', 'unicode', 'weakref', 'zipfile', 'zlib',
+]
+
+ERRORS = [
+    'AssertionError: 1 != 2',
+    "AssertionError: 'abc' not found in 'xyz'",
+    'TimeoutError: timed out',
+    "KeyError: 'missing'",
+    'OSError: [Errno 98] Address already in use',
+    'ValueError: invalid literal for int() with base 10',
+]
+
+LOGS_METHODS = [
+    'get_tracebacks',
+    'get_leaks',
+    'get_failed_tests',
+    'get_rerun_tests',
+    'get_failed_subtests',
+    'test_summary',
+    'format_failing_tests',
+]
+
+
+class RegrtestRun:
+    """Output of a made-up regrtest run, as stdio log lines"""
+
+    def __init__(self, rnd, number):
+        self.rnd = rnd
+        self.number = number
+        self.refleaks = rnd.random() < 0.3
+        self.verbose = rnd.random() < 0.3
+        self.failure_rate = rnd.choice([0.005, 0.02, 0.1])
+        self.tests = [
+            f'test_{rnd.choice(SYLLABLES)}_{i}' for i in range(TESTS_PER_RUN)
+        ]
+        self.failed = {}
+        self.clock = 0
+
+    def iter_lines(self):
+        rnd = self.rnd
+        yield (
+            f'o== CPython 3.14.0a{self.number % 8}+'
+            + f' (heads/main:{rnd.getrandbits(36):09x})'
+        )
+        yield f'o== Python build: debug{" refleak" if self.refleaks else ""}'
+        yield (
+            f'o0:00:00 load avg: {rnd.uniform(0, 8):.2f}'
+            + f' Run {len(self.tests)} tests in parallel using 4 worker processes'
+        )
+        for index, test in enumerate(self.tests, 1):
+            yield from self.iter_test(index, test)
+        yield from self.iter_summary()
+
+    def _timestamp(self):
+        self.clock += self.rnd.randint(0, 3)
+        minutes, seconds = divmod(self.clock, 60)
+        return (
+            f'o0:{minutes:02}:{seconds:02}'
+            + f' load avg: {self.rnd.uniform(0, 8):.2f}'
+        )
+
+    def _progress(self, index, test, result=''):
+        progress = f'{index:3}/{len(self.tests)}'
+        if self.failed:
+            progress += f'/{len(self.failed)}'
+        return f'{self._timestamp()} [{progress}] {test}{result}'
+
+    def iter_test(self, index, test):
+        rnd = self.rnd
+        failures = []
+        if rnd.random() < self.failure_rate:
+            failures = [
+                (f'test_{rnd.choice(SYLLABLES)}_{i}', rnd.choice(['FAIL', 'ERROR']))
+                for i in range(rnd.randint(1, 4))
+            ]
+        if self.verbose or failures:
+            names = [name for name, kind in failures] + [
+                f'test_{rnd.choice(SYLLABLES)}' for i in range(rnd.randint(2, 20))
+            ]
+            rnd.shuffle(names)
+            yield from self.iter_verbose(test, names, failures)
+        if self.refleaks:
+            yield (
+                'obeginning 6 repetitions. Showing number of leaks'
+                + ' (. for 0 or less, X for 10 or more)'
+            )
+            yield 'o123:456'
+            leaked = rnd.random() < 0.05
+            yield 'o' + ('XX' if leaked else '..') + '....'
+            if leaked:
+                kind = rnd.choice(
+                    ['references', 'memory blocks', 'file descriptors']
+                )
+                counts = [rnd.randint(1, 20)] * 3
+                yield f'o{test} leaked {counts} {kind}, sum={sum(counts)}'
+        if rnd.random() < 0.02:
+            # Warnings go to stderr, between stdout lines
+            yield (
+                f'eWarning -- {test} leaked temporary files (1):'
+                + f' @test_{rnd.randint(1, 99999)}_tmp'
+            )
+        if failures:
+            self.failed[test] = failures
+            yield self._progress(index, test, f' failed ({len(failures)} failures)')
+        else:
+            yield self._progress(index, test)
+
+    def iter_verbose(self, test, names, failures):
+        """Output of *test* in verbose mode, running the tests *names*
+
+        *failures* are (name, "FAIL" or "ERROR") pairs.
+        """
+        rnd = self.rnd
+        module = f'test.{test}'
+        results = dict(failures)
+        for name in names:
+            yield f'o{name} ({module}.Tests.{name}) ... {results.get(name, "ok")}'
+        for name, kind in failures:
+            yield from self.iter_report(module, name, kind)
+        yield 'o' + '-' * 70
+        yield f'oRan {len(names)} tests in {rnd.uniform(0, 30):.3f}s'
+        yield 'o'
+        yield f'oFAILED (failures={len(failures)})' if failures else 'oOK'
+
+    def iter_report(self, module, name, kind):
+        rnd = self.rnd
+        yield 'e' + '=' * 70
+        yield f'e{kind}: {name} ({module}.Tests.{name})'
+        yield 'e' + '-' * 70
+        yield 'eTraceback (most recent call last):'
+        for depth in range(rnd.randint(1, 12)):
+            yield (
+                f'e  File "/Lib/{module.replace(".", "/")}.py",'
+                + f' line {rnd.randint(1, 3000)}, in {name}'
+            )
+            yield f'e    helper_{depth}(self, {rnd.randint(0, 9)})'
+        yield f'e{rnd.choice(ERRORS)}'
+        yield 'e'
+
+    def iter_summary(self):
+        failed = list(self.failed)
+        ok = len(self.tests) - len(failed)
+        result = 'FAILURE' if failed else 'SUCCESS'
+        plural = 's' if len(failed) > 1 else ''
+        yield 'o'
+        yield f'o== Tests result: {result} =='
+        yield 'o'
+        yield f'o{ok} tests OK.'
+        if failed:
+            yield 'o'
+            yield from self._test_list(
+                f'{len(failed)} test{plural} failed:', failed,
+            )
+            yield 'o'
+            yield (
+                f'{self._timestamp()} Re-running {len(failed)}'
+                + ' failed tests in verbose mode'
+            )
+            for test, failures in self.failed.items():
+                names = [name for name, kind in failures]
+                yield (
+                    f'{self._timestamp()} Re-running {test} in verbose mode'
+                    + f' (matching: {" ".join(names)})'
+                )
+                # About half of the failures are fixed by the re-run
+                failures = [f for f in failures if self.rnd.random() < 0.5]
+                yield from self.iter_verbose(test, names, failures)
+            yield 'o'
+            yield from self._test_list(
+                f'{len(failed)} re-run test{plural}:', failed,
+            )
+        yield 'o'
+        yield f'oTotal duration: {self.clock // 60} min {self.clock % 60} sec'
+        yield (
+            f'oTotal tests: run={len(self.tests) * 20:,}'
+            + f' failures={len(failed)} skipped=123'
+        )
+        yield (
+            f'oTotal test files: run={len(self.tests)}/{len(self.tests)}'
+            + f' failed={len(failed)}'
+        )
+        yield 'o'
+        yield f'oTests result: {result}'
+
+    def _test_list(self, header, tests):
+        yield 'o' + header
+        for i in range(0, len(tests), 6):
+            yield 'o    ' + ' '.join(tests[i:i + 6])
+
+
+def write_log(path, size, seed):
+    """Write whole regrtest runs to *path* until it's at least *size* bytes"""
+    rnd = random.Random(seed)
+    written = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for number in itertools.count():
+            text = '\n'.join(RegrtestRun(rnd, number).iter_lines()) + '\n'
+            file.write(text)
+            written += len(text.encode())
+            if written >= size:
+                break
+
+
+def get_corpus(directory, size_mb, seed):
+    """Return the path of a corpus log of *size_mb* MB, making it if needed"""
+    path = directory / f'regrtest-{size_mb:g}MB-seed{seed}.log'
+    if not path.exists():
+        start = time.perf_counter()
+        write_log(path.with_suffix('.tmp'), int(size_mb * 1e6), seed)
+        path.with_suffix('.tmp').rename(path)
+        print(
+            f'Wrote {path.name} ({path.stat().st_size / 1e6:.1f} MB)'
+            + f' in {time.perf_counter() - start:.1f} s'
+        )
+    return path
+
+
+def count_lines(path):
+    count = 0
+    with open(path, 'rb') as file:
+        while chunk := file.read(2**20):
+            count += chunk.count(b'\n')
+    return count
+
+
+class FileLogData:
+    """Stand-in for Buildbot's data API, serving a log's content from a file
+
+    Only ("logs", logid, "contents") is supported, and its chunks must be
+    read in order, as stream_logs_and_tracebacks_from_build does.
+    """
+
+    LOGID = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.num_lines = count_lines(path)
+        self._file = None
+        self._next_line = 0
+
+    def get(self, path, offset=None, limit=None):
+        if path != ('logs', self.LOGID, 'contents'):
+            raise NotImplementedError(path)
+        if offset == 0:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, encoding='utf-8')
+            self._next_line = 0
+        if offset != self._next_line:
+            raise NotImplementedError(f'reading line {offset} out of order')
+        content = ''.join(itertools.islice(self._file, limit))
+        self._next_line += limit
+        return defer.succeed(
+            {'logid': self.LOGID, 'firstline': offset, 'content': content}
+        )
+
+
+class FakeMaster:
+    def __init__(self, data):
+        self.data = data
+
+
+class Benchmark:
+    def __init__(self, path, repeat):
+        self.path = path
+        self.repeat = repeat
+        self.megabytes = path.stat().st_size / 1e6
+        self.data = FileLogData(path)
+
+    def get_analyses(self):
+        """Return {name: function that returns a Deferred}, for each analysis
+
+        The inputs are made beforehand, so they aren't measured.
+        """
+        content = self.path.read_text(encoding='utf-8')
+        # The log without the streams, split in chunks to save memory
+        text = '\n'.join(
+            '\n'.join([line.lstrip('eo') for line in chunk.splitlines()])
+            for chunk in testsuite_utils.iter_line_chunks(content)
+        )
+        build = {
+            'steps': [{
+                'name': testsuite_utils.TESTS_STEP,
+                'logs': [{'content': {'content': content}}],
+            }],
+        }
+        streamed_build = {
+            'steps': [{
+                'name': testsuite_utils.TESTS_STEP,
+                'logs': [{
+                    'logid': FileLogData.LOGID,
+                    'num_lines': self.data.num_lines,
+                }],
+            }],
+        }
+        master = FakeMaster(self.data)
+
+        def call_logs_method(name):
+            result = getattr(Logs(text), name)()
+            if name.startswith('get_'):
+                result = list(result)
+            return defer.succeed(result)
+
+        analyses = {
+            f'Logs.{name}': lambda name=name: call_logs_method(name)
+            for name in LOGS_METHODS
+        }
+        analyses['get_logs_and_tracebacks_from_build'] = lambda: defer.succeed(
+            testsuite_utils.get_logs_and_tracebacks_from_build(build)
+        )
+        analyses['stream_logs_and_tracebacks_from_build'] = lambda: (
+            testsuite_utils.stream_logs_and_tracebacks_from_build(
+                master, streamed_build,
+            )
+        )
+        return analyses
+
+    @defer.inlineCallbacks
+    def run(self):
+        analyses = self.get_analyses()
+        results = {}
+        for name, analyze in analyses.items():
+            times = []
+            while len(times) < self.repeat and sum(times) < REPEAT_SECONDS:
+                start = time.perf_counter()
+                yield analyze()
+                times.append(time.perf_counter() - start)
+            seconds = min(times)
+            results[name] = {
+                'seconds': seconds,
+                'megabytes_per_second': self.megabytes / seconds,
+            }
+        for name, analyze in analyses.items():
+            tracemalloc.start()
+            yield analyze()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name]['peak_memory_bytes'] = peak
+        for name, result in results.items():
+            print(
+                f'{name + ":":<40}{result["seconds"]:8.2f} s'
+                + f'{result["megabytes_per_second"]:8.1f} MB/s'
+                + f'{result["peak_memory_bytes"] / 2**20:10.1f} MiB peak'
+            )
+        return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of regressions of *results* since *baseline*"""
+    problems = []
+    for corpus, analyses in results.items():
+        for name, result in analyses.items():
+            try:
+                previous = baseline[corpus][name]
+            except KeyError:
+                continue
+            speed = result['megabytes_per_second']
+            previous_speed = previous['megabytes_per_second']
+            if speed < previous_speed * (1 - tolerance):
+                problems.append(
+                    f'{corpus}, {name}: {speed:.1f} MB/s,'
+                    + f' was {previous_speed:.1f} MB/s'
+                )
+            peak = result['peak_memory_bytes']
+            previous_peak = previous['peak_memory_bytes']
+            if peak > previous_peak * (1 + tolerance):
+                problems.append(
+                    f'{corpus}, {name}: {peak / 2**20:.1f} MiB peak,'
+                    + f' was {previous_peak / 2**20:.1f} MiB'
+                )
+    return problems
+
+
+@defer.inlineCallbacks
+def run_benchmarks(reactor, args, corpus_dir):
+    results = {}
+    for size_mb in args.sizes:
+        path = get_corpus(corpus_dir, size_mb, args.seed)
+        benchmark = Benchmark(path, args.repeat)
+        print(f'{path.name} ({benchmark.megabytes:.1f} MB):')
+        results[path.name] = yield benchmark.run()
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=4))
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print(f'FAIL: {problem}')
+        if problems:
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.partition('\n')[0],
+    )
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 50, 500],
+                        metavar='MB',
+                        help='sizes of the corpus logs, in MB'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--corpus-dir', type=Path, metavar='DIR',
+                        help='keep the corpus logs in DIR, and reuse them'
+                             + ' (default: a temporary directory)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='maximum number of times each analysis is timed'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--json', type=Path, metavar='FILE',
+                        help='also write the results to FILE, as JSON')
+    parser.add_argument('--compare', type=Path, metavar='FILE',
+                        help='fail on regressions since FILE, the --json'
+                             + ' output of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction of throughput that may be lost, or'
+                             + ' of peak memory that may be gained, with'
+                             + ' --compare (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.corpus_dir:
+        args.corpus_dir.mkdir(parents=True, exist_ok=True)
+        task.react(run_benchmarks, [args, args.corpus_dir])
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            task.react(run_benchmarks, [args, Path(directory)])
+
+
+if __name__ == '__main__':
+    main()
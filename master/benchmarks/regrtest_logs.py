@@ -0,0 +1,158 @@
+"""Check that regrtest log analysis stays linear on adversarial logs
+
+Analyzes (with custom.testsuite_utils.Logs) logs made to be hard
+to extract tracebacks from: a "Traceback" on every line and nothing that
+ends one, thousands of different tracebacks, one huge traceback, a huge
+line. Each log is analyzed at two sizes, SIZE_FACTOR apart; the check
+fails if that more than MAX_SLOWDOWN-folds the time (the best of REPEAT
+runs), or if the tracebacks aren't capped as they should be.
+
+Run from the repository root:
+
+    venv/bin/python master/benchmarks/regrtest_logs.py --help
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom import testsuite_utils  # noqa: E402
+from custom.testsuite_utils import Logs  # noqa: E402
+
+# Quadrupling the size of a log should quadruple the time, not multiply
+# it by 16; allow for noise in between
+SIZE_FACTOR = 4
+MAX_SLOWDOWN = 8
+REPEAT = 3
+
+# Longest possible traceback: cut lines, plus the "lines omitted" line
+MAX_TRACEBACK_SIZE = (
+    (testsuite_utils.TRACEBACK_HEAD_LINES + testsuite_utils.TRACEBACK_TAIL_LINES)
+    * (testsuite_utils.MAX_TRACEBACK_LINE_LENGTH + len("...\n"))
+    + 100
+)
+
+
+def _repeat_lines(make_line, size):
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = make_line(i)
+        lines.append(line)
+        total += len(line) + 1
+        i += 1
+    return "\n".join(lines)
+
+
+def traceback_storm(size):
+    # Every line starts a traceback; nothing ends one
+    return _repeat_lines(
+        lambda i: f"Traceback (most recent call last): {i}", size,
+    )
+
+
+def many_tracebacks(size):
+    return _repeat_lines(
+        lambda i: (
+            "Traceback (most recent call last):\n"
+            + f'  File "test_{i}.py", line {i}, in test_{i}\n'
+            + f"AssertionError: {i}\n"
+        ),
+        size,
+    )
+
+
+def huge_traceback(size):
+    return "Traceback (most recent call last):\n" + _repeat_lines(
+        lambda i: f'  File "recursive.py", line {i}, in f', size,
+    ) + "\nRecursionError: maximum recursion depth exceeded\n"
+
+
+def huge_line(size):
+    # It's quick to analyze: make it longer than the others, for timings
+    # that aren't mostly noise
+    return "Traceback: " + "x" * (4 * size) + "\n\n"
+
+
+ADVERSARIAL_LOGS = {
+    'traceback storm': traceback_storm,
+    'many tracebacks': many_tracebacks,
+    'huge traceback': huge_traceback,
+    'huge line': huge_line,
+}
+
+
+def analyze(text):
+    """Get everything from a log, as reporters do
+
+    Return the best seconds taken in REPEAT runs, and the tracebacks.
+    """
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        logs = Logs(text)
+        tracebacks = list(logs.get_tracebacks())
+        logs.test_summary()
+        logs.format_failing_tests()
+        timings.append(time.perf_counter() - start)
+    return min(timings), tracebacks
+
+
+def check_adversarial_logs(size):
+    """Analyze ADVERSARIAL_LOGS; return (results, list of problems)"""
+    results = {}
+    problems = []
+    for name, make_log in ADVERSARIAL_LOGS.items():
+        timings = []
+        for log_size in (size, SIZE_FACTOR * size):
+            seconds, tracebacks = analyze(make_log(log_size))
+            timings.append(seconds)
+            if len(tracebacks) > testsuite_utils.MAX_TRACEBACKS:
+                problems.append(f'{name}: {len(tracebacks)} tracebacks')
+            longest = max(map(len, tracebacks), default=0)
+            if longest > MAX_TRACEBACK_SIZE:
+                problems.append(f'{name}: a traceback of {longest} characters')
+        slowdown = timings[1] / timings[0]
+        if slowdown > MAX_SLOWDOWN:
+            problems.append(
+                f'{name}: {slowdown:.1f} times slower at'
+                + f' {SIZE_FACTOR} times the size'
+            )
+        results[name] = {
+            'seconds': timings,
+            'megabytes_per_second': SIZE_FACTOR * size / 1e6 / timings[1],
+        }
+        print(
+            f'{name + ":":<20} {timings[0]:7.3f} s, {timings[1]:7.3f} s'
+            + f' at {SIZE_FACTOR} times the size ({slowdown:.1f}x)'
+        )
+    return results, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.partition('\n')[0],
+    )
+    parser.add_argument('--size', type=float, default=4,
+                        help='size of the smaller logs, in MB'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--json', type=Path, metavar='FILE',
+                        help='also write the results to FILE, as JSON')
+    args = parser.parse_args()
+
+    results, problems = check_adversarial_logs(int(args.size * 1e6))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=4))
+    for problem in problems:
+        print(f'FAIL: {problem}')
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
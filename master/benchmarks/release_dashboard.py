@@ -0,0 +1,547 @@
+"""Benchmark the release dashboard on a synthetic fleet
+
+Renders the dashboard (ReleaseDashboard.get_release_status()) with
+FakeDataAPI, a stand-in for Buildbot's data API that makes up builders
+and builds, and JUnit XML files for the failing builds of stable builders.
+No Buildbot master is needed.
+
+Renders are timed with cold caches (a new dashboard), warm caches
+(nothing changed since the last render), after new builds came in, and
+after a restart (a new dashboard with the previous persistent caches).
+The memory peak of a cold render is measured separately, since tracing
+allocations slows everything down.
+
+The benchmark fails (with exit status 1) if a cold render makes more
+Buildbot API calls than expected for the fleet, which usually means that
+something is fetched builder by builder.
+
+Run from the repository root:
+
+    venv/bin/python master/benchmarks/release_dashboard.py --help
+"""
+
+import argparse
+import datetime
+import gzip
+import heapq
+import itertools
+import json
+import operator
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from custom.release_dashboard import ReleaseDashboard  # noqa: E402
+
+SUCCESS, WARNINGS, FAILURE, SKIPPED, EXCEPTION = range(5)
+
+# buildid = builderid * BUILDID_FACTOR + build number
+BUILDID_FACTOR = 1_000_000
+
+# API calls a cold render is expected to make: builds are fetched in bulk
+# (a page for many builders), failing builders need their changes (and, for
+# streaks older than the builds shown, a few queries), plus the fleet-wide
+# queries
+COLD_API_CALLS_PER_BUILDER = 0.05
+COLD_API_CALLS_PER_FAILING_BUILDER = 1.5
+COLD_API_CALLS_OVERHEAD = 20
+
+
+class FakeDataAPI:
+    """Stand-in for Buildbot's data API, with a made-up fleet
+
+    Only the queries the dashboard makes are supported; others raise
+    NotImplementedError, so changes to the dashboard's queries don't go
+    unnoticed.
+
+    Builds are generated on demand from the builder's schedule and the seed,
+    so big fleets don't need much memory. Each builder completes a build
+    every `interval` seconds; advance() moves the clock forward, making
+    new builds appear.
+    """
+
+    def __init__(self, branch_tags, n_builders=400, n_builds=200,
+                 failing_rate=0.3, disconnected_rate=0.05, seed=0):
+        self.seed = seed
+        self.now = time.time()
+        self.branch_tags = branch_tags
+        self.builders = []
+        self.workers = []
+        # builderid -> (build interval, complete_at of build 0,
+        #               first build number of the current failing streak)
+        self._schedules = {}
+
+        rnd = random.Random(seed)
+        for i in range(n_builders):
+            builderid = i + 1
+            tag = branch_tags[i % len(branch_tags)]
+            tags = [tag, f'tier-{rnd.randint(1, 3)}']
+            if rnd.random() < 0.5:
+                tags.append('stable')
+            self.builders.append({
+                'builderid': builderid,
+                'name': f'Fake Builder {i // len(branch_tags)} {tag}',
+                'tags': tags,
+                'masterids': [1],
+            })
+            self.workers.append({
+                'workerid': builderid,
+                'name': f'fake-worker-{builderid}',
+                'configured_on': [{'builderid': builderid, 'masterid': 1}],
+                'connected_to': (
+                    [] if rnd.random() < disconnected_rate
+                    else [{'masterid': 1}]
+                ),
+            })
+            interval = rnd.choice([30 * 60, 60 * 60, 3 * 60 * 60, 24 * 60 * 60])
+            first_complete_at = (
+                self.now - rnd.uniform(0, interval) - (n_builds - 1) * interval
+            )
+            streak_start = None
+            if rnd.random() < failing_rate:
+                streak_start = n_builds - rnd.randint(1, 30)
+            self._schedules[builderid] = (
+                interval, first_complete_at, streak_start,
+            )
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def dataGet(self, path, filters=None, fields=None, order=None,
+                limit=None, offset=None):
+        if isinstance(path, str):
+            path = tuple(path.strip('/').split('/'))
+        filters = {(f.field, f.op): f.values for f in filters or ()}
+        if order not in (None, ['-complete_at'], ['complete_at']):
+            raise NotImplementedError(order)
+
+        match path:
+            case ('workers',):
+                return list(self.workers)
+            case ('builders',):
+                return list(self.builders)
+            case ('builders', builderid):
+                return self._get_builder(int(builderid))
+            case ('builders', builderid, 'builds'):
+                builds = self._iter_builds(int(builderid))
+            case ('builds',):
+                builderids = filters.pop(('builderid', 'eq'), None)
+                if builderids is None:
+                    builderids = [b['builderid'] for b in self.builders]
+                builds = heapq.merge(
+                    *(self._iter_builds(b) for b in builderids),
+                    key=lambda info: info['complete_at'],
+                    reverse=True,
+                )
+            case ('builds', buildid):
+                builderid, number = divmod(int(buildid), BUILDID_FACTOR)
+                if self._get_builder(builderid) is None:
+                    return None
+                if not 0 <= number <= self._get_latest_number(builderid):
+                    return None
+                return self._make_build(builderid, number)
+            case ('builds', buildid, 'changes'):
+                return self._make_changes(int(buildid))[:limit]
+            case ('buildrequests',):
+                requestids = filters.pop(('buildrequestid', 'eq'))
+                self._check_filters(filters)
+                return [
+                    {'buildrequestid': requestid, 'buildsetid': requestid}
+                    for requestid in requestids
+                ]
+            case ('buildsets',):
+                bsids = filters.pop(('bsid', 'eq'))
+                self._check_filters(filters)
+                return [
+                    {'bsid': bsid, 'sourcestamps': [
+                        {'ssid': self._get_ssid(bsid)},
+                    ]}
+                    for bsid in bsids
+                ]
+            case _:
+                raise NotImplementedError(path)
+
+        # The builds are generated newest first
+        if filters.pop(('complete', 'eq'), None) not in (None, ['True']):
+            raise NotImplementedError(filters)
+        for op in 'ge', 'gt', 'le', 'lt':
+            values = filters.pop(('complete_at', op), None)
+            if values is None:
+                continue
+            [value] = values
+            compare = getattr(operator, op)
+
+            def matches(info, compare=compare, value=value):
+                return compare(info['complete_at'].timestamp(), value)
+
+            if op in ('ge', 'gt'):
+                builds = itertools.takewhile(matches, builds)
+            else:
+                builds = filter(matches, builds)
+        results = filters.pop(('results', 'eq'), None)
+        if results is not None:
+            builds = (info for info in builds if info['results'] in results)
+        self._check_filters(filters)
+        if order == ['complete_at']:
+            builds = reversed(list(builds))
+        start = offset or 0
+        stop = None if limit is None else start + limit
+        return list(itertools.islice(builds, start, stop))
+
+    def _check_filters(self, filters):
+        if filters:
+            raise NotImplementedError(filters)
+
+    def _get_builder(self, builderid):
+        if 1 <= builderid <= len(self.builders):
+            return self.builders[builderid - 1]
+        return None
+
+    def _get_latest_number(self, builderid):
+        interval, first_complete_at, streak_start = self._schedules[builderid]
+        return int((self.now - first_complete_at) // interval)
+
+    def _iter_builds(self, builderid):
+        """Yield the builder's builds, newest first"""
+        for number in range(self._get_latest_number(builderid), -1, -1):
+            yield self._make_build(builderid, number)
+
+    def _get_results(self, builderid, number):
+        interval, first_complete_at, streak_start = self._schedules[builderid]
+        if streak_start is not None and number >= streak_start:
+            return FAILURE
+        rnd = random.Random(f'{self.seed}-{builderid}-{number}')
+        return rnd.choices(
+            [SUCCESS, WARNINGS, FAILURE, EXCEPTION],
+            weights=[90, 3, 6, 1],
+        )[0]
+
+    def _make_build(self, builderid, number):
+        interval, first_complete_at, streak_start = self._schedules[builderid]
+        # Buildbot stores times in whole seconds
+        complete_at = int(first_complete_at + number * interval)
+        started_at = int(complete_at - interval * 0.8)
+        buildid = builderid * BUILDID_FACTOR + number
+        return {
+            'buildid': buildid,
+            'number': number,
+            'builderid': builderid,
+            'buildrequestid': buildid,
+            'workerid': builderid,
+            'masterid': 1,
+            'started_at': _datetime(started_at),
+            'complete_at': _datetime(complete_at),
+            'locks_duration_s': 0,
+            'complete': True,
+            'results': self._get_results(builderid, number),
+            'state_string': 'finished',
+            'properties': {},
+        }
+
+    def _get_ssid(self, buildid):
+        # Builds of a branch that started in the same 10 minutes
+        # built the same commit
+        builderid, number = divmod(buildid, BUILDID_FACTOR)
+        builder = self._get_builder(builderid)
+        branch_index = self.branch_tags.index(builder['tags'][0])
+        started_at = self._make_build(builderid, number)['started_at']
+        return branch_index * BUILDID_FACTOR + int(started_at.timestamp() // 600)
+
+    def _make_changes(self, buildid):
+        rnd = random.Random(f'{self.seed}-changes-{buildid}')
+        changes = []
+        for i in range(rnd.randint(0, 6)):
+            revision = rnd.randbytes(20).hex()
+            issue = rnd.randint(100000, 140000)
+            changes.append({
+                'changeid': rnd.randint(1, 10**6),
+                'author': f'Fake Author {i} <author{i}@example.org>',
+                'comments': f'gh-{issue}: Fix something\n\nDetails.\n',
+                'revision': revision,
+                'revlink': f'https://github.com/python/cpython/commit/{revision}',
+                'files': [
+                    f'Lib/test/test_fake{n}.py'
+                    for n in range(rnd.randint(1, 8))
+                ],
+            })
+        return changes
+
+    def iter_shown_failures(self):
+        """Yield (builder info, build number) of builds the dashboard shows
+
+        That is the latest build of a failing builder, and the first build
+        of its failing streak.
+        """
+        for builder in self.builders:
+            builderid = builder['builderid']
+            latest = self._get_latest_number(builderid)
+            if self._get_results(builderid, latest) != FAILURE:
+                continue
+            first = latest
+            while first > 0 and (
+                self._get_results(builderid, first - 1) == FAILURE
+            ):
+                first -= 1
+            yield builder, latest
+            if first != latest:
+                yield builder, first
+
+
+def _datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def make_branch_info(n_branches):
+    """Make up release cycle info (like release-cycle.json) and branch tags
+    """
+    newest = 7 + n_branches
+    info = {}
+    tags = []
+    for minor in range(newest, newest - n_branches, -1):
+        version = f'3.{minor}'
+        if minor == newest:
+            status, branch, tag = 'feature', 'main', '3.x'
+        else:
+            status = 'bugfix' if minor >= newest - 2 else 'security'
+            branch = tag = version
+        info[version] = {
+            'branch': branch,
+            'pep': 500 + minor,
+            'status': status,
+            'first_release': f'{2011 + minor}-10-01',
+            'end_of_life': f'{2016 + minor}-10',
+            'release_manager': 'Fake Manager',
+        }
+        tags.append(tag)
+    info['3.0'] = {
+        'branch': '3.0',
+        'pep': 361,
+        'status': 'end-of-life',
+        'first_release': '2008-12-03',
+        'end_of_life': '2009-06-27',
+        'release_manager': 'Fake Manager',
+    }
+    return info, tags
+
+
+def write_junit_file(path, rnd, n_cases, n_errors, traceback_lines):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    failing = set(rnd.sample(range(n_cases), min(n_errors, n_cases)))
+    with path.open('w', encoding='utf-8') as file:
+        file.write(f'<testsuites><testsuite tests="{n_cases}">\n')
+        for i in range(n_cases):
+            name = f'test.test_fake{i % 50}.FakeTests{i % 7}.test_{i}'
+            if i in failing:
+                exc_type = rnd.choice(
+                    ['AssertionError', 'OSError', 'TimeoutError'],
+                )
+                traceback = '\n'.join(
+                    f'  File "Lib/test/test_fake.py", line {n}, in f'
+                    for n in range(rnd.randint(1, traceback_lines))
+                )
+                file.write(
+                    f'<testcase name="{name}" status="run" result="completed"'
+                    f' time="{rnd.uniform(0, 10):.3f}">'
+                    f'<error type="{exc_type}" message="fake failure">'
+                    f'Traceback (most recent call last):\n{traceback}\n'
+                    f'{exc_type}: fake failure</error></testcase>\n'
+                )
+            else:
+                file.write(
+                    f'<testcase name="{name}" status="run" result="completed"'
+                    f' time="{rnd.uniform(0, 1):.3f}" />\n'
+                )
+        file.write('</testsuite></testsuites>\n')
+
+
+def write_junit_fixtures(api, directory, max_cases, max_errors,
+                         traceback_lines, seed=0):
+    """Write JUnit XML files for the stable builds the dashboard shows
+
+    Return the number of files and their total size.
+    """
+    rnd = random.Random(seed)
+    count = size = 0
+    for builder, number in api.iter_shown_failures():
+        if 'stable' not in builder['tags']:
+            continue
+        path = (
+            directory / builder['tags'][0] / builder['name']
+            / f'build_{number}.xml'
+        )
+        write_junit_file(
+            path, rnd,
+            n_cases=rnd.randint(1, max_cases),
+            n_errors=rnd.randint(1, max_errors),
+            traceback_lines=traceback_lines,
+        )
+        count += 1
+        size += path.stat().st_size
+    return count, size
+
+
+class Benchmark:
+    def __init__(self, args, directory):
+        branch_info, branch_tags = make_branch_info(args.branches)
+        self.branch_info_path = directory / 'release-cycle.json'
+        self.branch_info_path.write_text(json.dumps(branch_info))
+        self.test_result_dir = directory / 'test-results'
+        self.test_result_dir.mkdir()
+        self.api = FakeDataAPI(
+            branch_tags,
+            n_builders=args.builders,
+            n_builds=args.builds,
+            failing_rate=args.failing_rate,
+            seed=args.seed,
+        )
+        start = time.perf_counter()
+        n_files, size = write_junit_fixtures(
+            self.api, self.test_result_dir,
+            max_cases=args.junit_cases,
+            max_errors=args.junit_errors,
+            traceback_lines=args.traceback_lines,
+            seed=args.seed,
+        )
+        print(
+            f'Fleet: {args.branches} branches, {args.builders} builders,'
+            + f' {args.builds} builds each; {n_files} JUnit XML files'
+            + f' ({size / 1e6:.1f} MB, written in'
+            + f' {time.perf_counter() - start:.1f} s)'
+        )
+        self.results = {}
+
+    def make_dashboard(self):
+        dashboard = ReleaseDashboard(
+            test_result_dir=self.test_result_dir,
+            branches_url=self.branch_info_path.as_uri(),
+        )
+        dashboard.flask_app.buildbot_api = self.api
+        return dashboard
+
+    def render(self, dashboard):
+        with dashboard.flask_app.test_request_context():
+            start = time.perf_counter()
+            rendering = dashboard.get_release_status()
+            return time.perf_counter() - start, rendering
+
+    def report(self, label, times, rendering):
+        metrics = rendering.metrics.counters
+        self.results[label] = {
+            'seconds': min(times),
+            'median_seconds': statistics.median(times),
+            **metrics,
+        }
+        timing = f'{min(times):8.3f} s'
+        if len(times) > 1:
+            timing += f' (median {statistics.median(times):.3f} s)'
+        print(
+            f'{label + ":":28}{timing:28}'
+            + f'{metrics["dataget_calls"]:6} API calls'
+            + f'{metrics["dataget_rows"]:9} rows'
+            + f'{metrics["junit_files_parsed"]:6} XML files parsed'
+        )
+
+    def run(self, repeat, advance):
+        dashboard = self.make_dashboard()
+        seconds, rendering = self.render(dashboard)
+        self.report('cold', [seconds], rendering)
+
+        times = []
+        for i in range(repeat):
+            seconds, rendering = self.render(dashboard)
+            times.append(seconds)
+        self.report('warm, no new builds', times, rendering)
+
+        times = []
+        for i in range(repeat):
+            self.api.advance(advance)
+            seconds, rendering = self.render(dashboard)
+            times.append(seconds)
+        self.report(f'warm, {advance} s of new builds', times, rendering)
+
+        restarted = self.make_dashboard()
+        restarted.junit_cache = dashboard.junit_cache
+        restarted.failure_streaks = dashboard.failure_streaks
+        seconds, rendering = self.render(restarted)
+        self.report('restart (warm caches)', [seconds], rendering)
+
+        html = rendering.html.encode()
+        self.results['html_bytes'] = len(html)
+        print(
+            f'Page size: {len(html) / 1e3:.0f} kB,'
+            + f' {len(gzip.compress(html)) / 1e3:.0f} kB gzipped'
+        )
+
+        tracemalloc.start()
+        self.render(self.make_dashboard())
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.results['cold_peak_memory_bytes'] = peak
+        print(f'Memory peak of a cold render: {peak / 2**20:.1f} MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.partition('\n')[0],
+    )
+    parser.add_argument('--branches', type=int, default=8,
+                        help='number of branches (default: %(default)s)')
+    parser.add_argument('--builders', type=int, default=400,
+                        help='number of builders (default: %(default)s)')
+    parser.add_argument('--builds', type=int, default=200,
+                        help='builds per builder (default: %(default)s)')
+    parser.add_argument('--failing-rate', type=float, default=0.3,
+                        help='fraction of builders in a failing streak'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--junit-cases', type=int, default=2000,
+                        help='maximum test cases per JUnit XML file'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--junit-errors', type=int, default=30,
+                        help='maximum errors per JUnit XML file'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--traceback-lines', type=int, default=40,
+                        help='maximum lines per traceback'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of warm renders (default: %(default)s)')
+    parser.add_argument('--advance', type=int, default=10 * 60,
+                        help='seconds between warm renders with new builds'
+                             + ' (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed (default: %(default)s)')
+    parser.add_argument('--max-cold-api-calls', type=int, metavar='N',
+                        help='fail if a cold render makes more API calls'
+                             + ' (default: estimated from the fleet)')
+    parser.add_argument('--json', type=Path, metavar='FILE',
+                        help='also write the results to FILE, as JSON')
+    args = parser.parse_args()
+    if args.max_cold_api_calls is None:
+        args.max_cold_api_calls = int(
+            COLD_API_CALLS_OVERHEAD
+            + COLD_API_CALLS_PER_BUILDER * args.builders
+            + COLD_API_CALLS_PER_FAILING_BUILDER
+            * args.failing_rate * args.builders
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        benchmark = Benchmark(args, Path(directory))
+        benchmark.run(args.repeat, args.advance)
+    if args.json:
+        args.json.write_text(json.dumps(benchmark.results, indent=4))
+    cold_calls = benchmark.results['cold']['dataget_calls']
+    if cold_calls > args.max_cold_api_calls:
+        print(
+            f'FAIL: a cold render made {cold_calls} API calls'
+            + f' (expected at most {args.max_cold_api_calls})'
+        )
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,10 @@
+from datetime import timedelta
+
 JUNIT_FILENAME = "test-results.xml"
+
+# Where UploadTestResults puts the JUnit XML files, on the master:
+# TEST_RESULT_DIR/<branch>/<builder name>/build_<build number>.xml
+TEST_RESULT_DIR = "/data/www/buildbot/test-results"
+# Test results are looked at as long as the logs of their builds are kept
+# (see the janitor in master.cfg); caches drop older ones
+TEST_RESULT_RETENTION = timedelta(days=180)
@@ -0,0 +1,103 @@
+"""Persistent failure streaks of builders, for the release dashboard
+
+A builder's failure streak is the failed builds since its last successful
+one. Finding where a streak started can mean going far back in the builder's
+history; StreakTable keeps the answer, and Streak.advance() brings it up to
+date with a builder's new builds.
+"""
+
+import datetime
+import sqlite3
+import threading
+from dataclasses import astuple, dataclass
+
+from buildbot.process.results import FAILURE, SUCCESS
+
+
+@dataclass
+class Streak:
+    builderid: int
+    # The newest build taken into account (by completion time)
+    last_complete_at: int
+    last_buildid: int
+    # The newest successful build (None if there's none)
+    last_success_buildid: int | None
+    # The oldest failed build since then (None if there's none)
+    start_buildid: int | None
+
+    def is_processed(self, build_info):
+        """Return true if the build is already taken into account"""
+        return _build_key(build_info) <= (
+            self.last_complete_at, self.last_buildid,
+        )
+
+    def advance(self, build_infos):
+        """Take new builds (in any order) into account"""
+        for info in sorted(build_infos, key=_build_key):
+            if self.is_processed(info):
+                continue
+            if info["results"] == SUCCESS:
+                self.last_success_buildid = info["buildid"]
+                self.start_buildid = None
+            elif info["results"] == FAILURE and self.start_buildid is None:
+                self.start_buildid = info["buildid"]
+            self.last_complete_at, self.last_buildid = _build_key(info)
+
+
+class StreakTable:
+    """Streaks of builders, by builderid
+
+    The table is in a SQLite database at *path*; without a path it's only
+    kept in memory.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(path) if path else ":memory:", check_same_thread=False
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS failure_streaks (
+                    builderid INTEGER PRIMARY KEY,
+                    last_complete_at INTEGER NOT NULL,
+                    last_buildid INTEGER NOT NULL,
+                    last_success_buildid INTEGER,
+                    start_buildid INTEGER
+                )
+                """
+            )
+
+    def get(self, builderid):
+        """Return the builder's Streak, or None if it's not known"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM failure_streaks WHERE builderid = ?",
+                (builderid,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Streak(*row)
+
+    def put(self, streak):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO failure_streaks VALUES (?, ?, ?, ?, ?)",
+                astuple(streak),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def get_timestamp(complete_at):
+    """Convert a build's complete_at (datetime or timestamp) to an int"""
+    if isinstance(complete_at, datetime.datetime):
+        return int(complete_at.timestamp())
+    return int(complete_at)
+
+
+def _build_key(build_info):
+    return get_timestamp(build_info["complete_at"]), build_info["buildid"]
@@ -15,10 +15,9 @@ from buildbot.process.results import (
 )
 from buildbot.util.giturlparse import giturlparse
 from buildbot.plugins import reporters
-from buildbot.reporters.utils import getDetailsForBuild
 
 from custom.builders import get_tier_from_tags
-from custom.testsuite_utils import get_logs_and_tracebacks_from_build
+from custom.testsuite_utils import get_build_analysis
 
 MESSAGE = """\
 :warning: **Buildbot failure** :warning:
@@ -59,11 +58,8 @@ class DiscordReporter(reporters.HttpStatusPush):
         if state != "failure":
             return
 
-        yield getDetailsForBuild(
-            self.master, build, want_logs=True, want_logs_content=True, want_steps=True
-        )
-
-        logs, _ = get_logs_and_tracebacks_from_build(build)
+        analysis = yield get_build_analysis(self.master, build)
+        logs = analysis.logs
 
         sourcestamps = build["buildset"].get("sourcestamps")
 
@@ -1,6 +1,8 @@
+from twisted.internet import defer
+
 from buildbot.plugins import reporters
 
-from custom.testsuite_utils import get_logs_and_tracebacks_from_build
+from custom.testsuite_utils import get_build_analysis
 
 MAIL_TEMPLATE = """\
 The Buildbot has detected a {{ status_detected }} on builder {{ buildername }} while building {{ projects }}.
@@ -44,14 +46,16 @@ TESTS_STEP = "test"
 
 
 class CustomMessageFormatter(reporters.MessageFormatter):
+    @defer.inlineCallbacks
     def buildAdditionalContext(self, master, ctx):
         ctx.update(self.context)
         build = ctx["build"]
 
-        logs, tracebacks = get_logs_and_tracebacks_from_build(build)
+        # The logs' content was fetched for us (to attach the logs)
+        analysis = yield get_build_analysis(master, build)
 
-        ctx["build"]["tracebacks"] = tracebacks
-        ctx["build"]["final_log"] = logs
+        ctx["build"]["tracebacks"] = analysis.tracebacks
+        ctx["build"]["final_log"] = analysis.logs
 
 
 MESSAGE_FORMATTER = CustomMessageFormatter(
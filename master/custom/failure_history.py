@@ -0,0 +1,225 @@
+"""Index of test failures, from the JUnit XML files of uploaded test results
+
+UploadTestResults puts the files at
+<test_result_dir>/<branch>/<buildername>/build_<number>.xml.
+FailureHistoryIndex reads each of them once, and records its failed test
+cases in a SQLite database, so questions like "how often did test_ssl fail
+on 3.x in the last 30 days, and on which builders?" don't need re-parsing
+thousands of files.
+
+Passing test cases aren't recorded (there are tens of thousands in each
+file), but each indexed build is, so failures can be compared to the
+number of builds.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from xml.etree import ElementTree
+
+from custom.junit_utils import iter_junit_failures
+
+_FILENAME_RE = re.compile(r'build_(\d+)\.xml')
+
+
+class FailureHistoryIndex:
+    """SQLite index of failed test cases in uploaded JUnit XML files
+
+    update() indexes files that appeared since the last update.
+    Each directory's modification time is kept as a watermark; directories
+    that didn't change since the last scan are skipped without listing them.
+
+    The database is at *path*; without a path it's only kept in memory.
+    """
+
+    def __init__(self, test_result_dir, path=None):
+        self.test_result_dir = test_result_dir
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(path) if path else ":memory:", check_same_thread=False
+        )
+        with self._lock, self._db:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS directories (
+                    branch TEXT NOT NULL,
+                    builder TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    PRIMARY KEY (branch, builder)
+                );
+                CREATE TABLE IF NOT EXISTS builds (
+                    branch TEXT NOT NULL,
+                    builder TEXT NOT NULL,
+                    build_number INTEGER NOT NULL,
+                    -- upload time of the file (seconds since the epoch)
+                    uploaded_at REAL NOT NULL,
+                    -- false if the file isn't valid XML
+                    valid INTEGER NOT NULL,
+                    PRIMARY KEY (branch, builder, build_number)
+                );
+                CREATE INDEX IF NOT EXISTS builds_by_time
+                    ON builds (branch, uploaded_at);
+                CREATE TABLE IF NOT EXISTS failures (
+                    test TEXT NOT NULL,
+                    branch TEXT NOT NULL,
+                    builder TEXT NOT NULL,
+                    build_number INTEGER NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    outcome TEXT NOT NULL,
+                    duration REAL,
+                    exception_type TEXT,
+                    -- a test case that failed in several runs of a build
+                    -- (re-runs) is recorded once
+                    UNIQUE (test, branch, builder, build_number)
+                );
+                CREATE INDEX IF NOT EXISTS failures_by_test
+                    ON failures (test, branch, uploaded_at);
+                """
+            )
+
+    def update(self):
+        """Index new files; return how many were indexed
+
+        If an update is already running (in another thread), wait for it
+        to finish first.
+        """
+        with self._update_lock:
+            count = 0
+            for branch_dir in _iter_subdirs(self.test_result_dir):
+                for builder_dir in _iter_subdirs(branch_dir):
+                    count += self._update_directory(builder_dir)
+            return count
+
+    def close(self):
+        """Close the database, once the running update() (if any) is done"""
+        with self._update_lock, self._lock:
+            self._db.close()
+
+    def _update_directory(self, directory):
+        branch = directory.parent.name
+        builder = directory.name
+        # Stat before listing: if a file is added while we list,
+        # the directory will look changed on the next scan.
+        mtime_ns = directory.stat().st_mtime_ns
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mtime_ns FROM directories"
+                " WHERE branch = ? AND builder = ?",
+                (branch, builder),
+            ).fetchone()
+            if row is not None and row[0] == mtime_ns:
+                return 0
+            indexed = {
+                number for (number,) in self._db.execute(
+                    "SELECT build_number FROM builds"
+                    " WHERE branch = ? AND builder = ?",
+                    (branch, builder),
+                )
+            }
+
+        count = 0
+        for path in directory.iterdir():
+            match = _FILENAME_RE.fullmatch(path.name)
+            if not match or int(match[1]) in indexed:
+                continue
+            try:
+                self._index_file(path, branch, builder, int(match[1]))
+            except OSError:
+                # Removed or unreadable; try again on the next scan
+                mtime_ns = None
+                continue
+            count += 1
+
+        if mtime_ns is not None:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                    (branch, builder, mtime_ns),
+                )
+        return count
+
+    def _index_file(self, path, branch, builder, build_number):
+        uploaded_at = path.stat().st_mtime
+        try:
+            with path.open("rb") as file:
+                failures = list(iter_junit_failures(file))
+            valid = True
+        except ElementTree.ParseError:
+            failures = []
+            valid = False
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?)",
+                (branch, builder, build_number, uploaded_at, valid),
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO failures"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (name, branch, builder, build_number, uploaded_at,
+                     outcome, duration, exception_type)
+                    for name, outcome, duration, exception_type in failures
+                ],
+            )
+
+    def get_failure_counts(self, test, branch, days=30):
+        """Return how often *test* failed on *branch* in the last *days*
+
+        *test* is a dotted test name, like "test.test_ssl" or
+        "test.test_ssl.ThreadedTests"; failures of the tests under it count.
+        A bare module name like "test_ssl" is looked up in the "test" package.
+
+        Return a list of dicts, one per builder with indexed builds in that
+        time, with the number of builds that had failures of *test*
+        and the number of indexed builds; builders with the most failing
+        builds are first.
+        """
+        if test.startswith("test_"):
+            test = f"test.{test}"
+        since = time.time() - days * 24 * 60 * 60
+        with self._lock:
+            failing = dict(self._db.execute(
+                """
+                SELECT builder, COUNT(DISTINCT build_number) FROM failures
+                WHERE (test = ? OR test GLOB ?)
+                    AND branch = ? AND uploaded_at >= ?
+                GROUP BY builder
+                """,
+                (test, _glob_escape(test) + ".*", branch, since),
+            ))
+            totals = self._db.execute(
+                """
+                SELECT builder, COUNT(*) FROM builds
+                WHERE branch = ? AND uploaded_at >= ? AND valid
+                GROUP BY builder
+                """,
+                (branch, since),
+            ).fetchall()
+        counts = [
+            {
+                'builder': builder,
+                'failing_builds': failing.get(builder, 0),
+                'builds': builds,
+            }
+            for builder, builds in totals
+        ]
+        counts.sort(key=lambda c: (-c['failing_builds'], c['builder']))
+        return counts
+
+
+def _iter_subdirs(path):
+    try:
+        entries = list(path.iterdir())
+    except FileNotFoundError:
+        return
+    for entry in sorted(entries):
+        if entry.is_dir():
+            yield entry
+
+
+def _glob_escape(text):
+    # In GLOB patterns, special characters are escaped by enclosing them
+    # in brackets
+    return re.sub(r'([*?\[])', r'[\1]', text)
@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from xml.etree import ElementTree
+
+from custom import TEST_RESULT_RETENTION
+
+
+def iter_junit_errors(source):
+    """Yield (name, errors) for each element of a JUnit XML file with errors
+
+    *name* is the element's "name" attribute (usually the dotted name of
+    a test), *errors* is a list of dicts with the attributes of its <error>
+    children, plus their text (the traceback) as "text".
+
+    The file is parsed incrementally and elements are dropped as soon as
+    they're processed, so memory use doesn't grow with the size of the file.
+    """
+    stack = []
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == "error":
+            # Handled (and dropped) with its parent
+            continue
+        errors = [
+            {**error.attrib, "text": error.text}
+            for error in elem.iterfind("error")
+        ]
+        if errors:
+            yield elem.attrib.get("name", "??"), errors
+        if stack:
+            stack[-1].remove(elem)
+
+
+class JunitSummaryCache:
+    """Persistent cache of iter_junit_errors() results for XML files
+
+    Entries are keyed by the file's path, modification time and size.
+    Uploaded test results never change, so each file is parsed only once.
+
+    The cache is a SQLite database at *path*; without a path it's only kept
+    in memory. When it's opened, entries of files that are gone or older
+    than *max_age* are dropped.
+    """
+
+    def __init__(self, path=None, max_age=TEST_RESULT_RETENTION):
+        self._lock = threading.Lock()
+        # Number and total size of files parsed (that is, cache misses)
+        self._parsed_files = 0
+        self._parsed_bytes = 0
+        self._db = sqlite3.connect(
+            str(path) if path else ":memory:", check_same_thread=False
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS junit_summaries (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    summary BLOB NOT NULL
+                )
+                """
+            )
+        self._prune(max_age)
+
+    def _prune(self, max_age):
+        min_mtime_ns = time.time_ns() - int(max_age.total_seconds() * 1e9)
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM junit_summaries WHERE mtime_ns < ?",
+                (min_mtime_ns,),
+            )
+            paths = self._db.execute(
+                "SELECT path FROM junit_summaries"
+            ).fetchall()
+            self._db.executemany(
+                "DELETE FROM junit_summaries WHERE path = ?",
+                [(path,) for (path,) in paths if not os.path.exists(path)],
+            )
+
+    def get(self, filepath):
+        """Return the list of (name, errors) pairs for an XML file
+
+        Return None if the file isn't valid XML. Raise OSError if it can't
+        be read.
+        """
+        stat = filepath.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mtime_ns, size, summary FROM junit_summaries"
+                " WHERE path = ?",
+                (str(filepath),),
+            ).fetchone()
+        if row is not None and tuple(row[:2]) == key:
+            return json.loads(zlib.decompress(row[2]))
+
+        try:
+            with filepath.open("rb") as file:
+                summary = list(iter_junit_errors(file))
+        except ElementTree.ParseError:
+            summary = None
+        data = zlib.compress(json.dumps(summary).encode())
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO junit_summaries VALUES (?, ?, ?, ?)",
+                (str(filepath), *key, data),
+            )
+            self._parsed_files += 1
+            self._parsed_bytes += stat.st_size
+        return summary
+
+    def parse_stats(self):
+        """Return the number and total size of files parsed so far"""
+        with self._lock:
+            return self._parsed_files, self._parsed_bytes
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def iter_junit_testcases(source):
+    """Yield (name, failure) for each test case of a JUnit XML file
+
+    *failure* is None if the test case passed (or was skipped). Otherwise
+    it's a dict with the "outcome" ("error" or "failure", after the child
+    element that marks the test case as failed), the exception "type",
+    the "duration" in seconds and the "text" (the traceback); each may be
+    None if unknown.
+
+    Like iter_junit_errors(), this parses the file incrementally.
+    """
+    stack = []
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != "testcase":
+            continue
+        failure = None
+        for outcome in ("error", "failure"):
+            child = elem.find(outcome)
+            if child is not None:
+                try:
+                    duration = float(elem.attrib["time"])
+                except (KeyError, ValueError):
+                    duration = None
+                failure = {
+                    "outcome": outcome,
+                    "type": child.attrib.get("type"),
+                    "duration": duration,
+                    "text": child.text,
+                }
+                break
+        yield elem.attrib.get("name", "??"), failure
+        if stack:
+            stack[-1].remove(elem)
+
+
+def iter_junit_failures(source):
+    """Yield (name, outcome, duration, exception type) for failed test cases
+
+    See iter_junit_testcases().
+    """
+    for name, failure in iter_junit_testcases(source):
+        if failure is not None:
+            yield name, failure["outcome"], failure["duration"], failure["type"]
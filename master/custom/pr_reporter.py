@@ -16,10 +16,9 @@ from buildbot.process.results import (
 )
 from buildbot.util.giturlparse import giturlparse
 from buildbot.plugins import reporters
-from buildbot.reporters.utils import getDetailsForBuild
 
 from custom.builders import get_tier_from_tags
-from custom.testsuite_utils import get_logs_and_tracebacks_from_build
+from custom.testsuite_utils import get_build_analysis
 
 PR_MESSAGE = """\
 :warning::warning::warning: Buildbot failure :warning::warning::warning:
@@ -96,9 +95,8 @@ class GitHubPullRequestReporter(reporters.GitHubStatusPush):
             )
             return
 
-        yield getDetailsForBuild(self.master, build, want_logs=True, want_logs_content=True, want_steps=True)
-
-        logs, tracebacks = get_logs_and_tracebacks_from_build(build)
+        analysis = yield get_build_analysis(self.master, build)
+        logs, tracebacks = analysis.logs, analysis.tracebacks
 
         context = yield props.render(self.context)
 
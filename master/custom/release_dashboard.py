@@ -1,36 +1,109 @@
+import bisect
 import contextlib
 import datetime
 import os
+import threading
 import time
 from functools import cached_property, total_ordering
 import enum
-from dataclasses import dataclass
+import gzip
+import hashlib
+from dataclasses import dataclass, field
 import itertools
 import urllib.request
 import urllib.error
 import json
+import uuid
+import zlib
 from pathlib import Path
-from xml.etree import ElementTree
 
 from flask import Flask
-from flask import render_template, request
+from flask import abort, get_template_attribute, jsonify, make_response
+from flask import render_template, request, stream_template
 import jinja2
+from markupsafe import Markup
 import humanize
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from buildbot.data.resultspec import Filter
 import buildbot.process.results
+from buildbot.util.service import BuildbotService
+from twisted.internet import defer, task, threads
+from twisted.python import log
+
+from custom.build_streaks import Streak, StreakTable, get_timestamp
+from custom.failure_history import FailureHistoryIndex
+from custom.junit_utils import JunitSummaryCache
+from custom.render_store import MemoryRenderStore
 
 N_BUILDS = 200
 MAX_CHANGES = 50
 
+# Only this many recent builds of each builder are fetched up front,
+# for all builders together, in pages of BUILDS_PAGE_SIZE; builders that
+# seem to have problems (see DashboardState._fetch_problem_histories()) get
+# the N_PROBLEM_BUILDS they show, again all together.
+# Older builds (up to N_BUILDS) are fetched per builder, when needed. A builder
+# that needs older builds usually needs many, so its first page has at least
+# N_PROBLEM_BUILDS: each round trip costs much more than a few rows.
+N_FIRST_BUILDS = 5
+BUILDS_PAGE_SIZE = 1000
+N_PROBLEM_BUILDS = 50
+
 
 # Cache result for 6 minutes. Generating the page is slow and a Python build
-# takes at least 5 minutes, a common build takes 10 to 30 minutes.  There is a
-# cronjob that forces a refresh every 5 minutes, so all human requests should
-# get a cache hit.
+# takes at least 5 minutes, a common build takes 10 to 30 minutes.
+# Stale results are still served while a new page is generated in the
+# background, and the page is regenerated every 5 minutes even when nobody
+# asks, so all human requests should get a cache hit.
 CACHE_DURATION = 6 * 60
+REFRESH_INTERVAL = 5 * 60
+
+# Processes that share the page (see PageCache) generate it in turns.
+# If the one generating dies, the others take over after this long.
+RENDER_LEASE_DURATION = 10 * 60
+# How often the others check for its result
+RENDER_STORE_POLL_INTERVAL = 1
+# After a failed generation, the next one is tried after this long,
+# doubled for each further failure (up to the refresh interval)
+RENDER_RETRY_DELAY = 10
+
+# Once we get the master's mq events (see ReleaseDashboardService), the page
+# is regenerated when builds finish and workers (dis)connect instead:
+# EVENT_DELAY seconds after an event, so that a burst of events causes only
+# one generation.
+# The timer is kept (with a longer interval) for times shown as "2 hours ago".
+MQ_EVENT_FILTERS = [
+    ('builds', None, 'finished'),
+    ('workers', None, 'connected'),
+    ('workers', None, 'disconnected'),
+]
+EVENT_DELAY = 30
+EVENT_REFRESH_INTERVAL = 15 * 60
+
+# Open browsers learn about changes from /api/events, by polling: it's an
+# event stream, but each response ends right away (an open stream would hold
+# a thread of the web server's pool, which the master also uses, e.g. to
+# analyze test logs), and browsers reconnect for the next one after this long.
+EVENT_POLL_INTERVAL = 30
+
+# Uploaded test results are indexed (see FailureHistoryIndex) when the
+# service starts, then this often, in a pool thread
+FAILURE_HISTORY_UPDATE_INTERVAL = 10 * 60
+
+# A branch's section of the page is re-rendered when the branch's latest
+# builds change, or after this long: it shows relative times, like "2 hours
+# ago", which go stale. Those are then off by no more than on a page that's
+# due for its refresh.
+FRAGMENT_MAX_AGE = REFRESH_INTERVAL
 
 BRANCHES_URL = "https://peps.python.org/api/release-cycle.json"
+# Release cycle info changes a few times a year; check for updates hourly.
+BRANCH_INFO_TTL = 60 * 60
+BRANCH_INFO_TIMEOUT = 30
 
 
 def _gimme_error(func):
@@ -56,7 +129,8 @@ class DashboardObject:
     Acts as a dict with the info we get (usually) from JSON API.
 
     All computed information should be cached using @cached_property.
-    For a fresh view, discard all these objects and build them again.
+    For a fresh view, DashboardState.refresh() discards the objects that
+    might be out of date, so they're built again.
     (Computing info on demand means the "for & if" logic in the template
     doesn't need to be duplicated in Python code.)
 
@@ -78,7 +152,17 @@ class DashboardObject:
         """Call Buildbot API"""
         # Buildbot sets `buildbot_api` as an attribute on the WSGI app,
         # a bit later than we'd like. Get to it dynamically.
-        return self._root._app.flask_app.buildbot_api.dataGet(*args, **kwargs)
+        api = self._root._app.flask_app.buildbot_api
+        start = time.perf_counter()
+        result = api.dataGet(*args, **kwargs)
+        metrics = self._root.metrics
+        metrics.count('dataget_seconds', time.perf_counter() - start)
+        metrics.count('dataget_calls')
+        if isinstance(result, list):
+            metrics.count('dataget_rows', len(result))
+        elif result is not None:
+            metrics.count('dataget_rows')
+        return result
 
     def __repr__(self):
         return f'<{type(self).__name__} at {id(self)}: {self._info}>'
@@ -86,33 +170,342 @@ class DashboardObject:
 
 class DashboardState(DashboardObject):
     """The root of our abstraction, a bit special.
+
+    Unlike the other objects, the state is long-lived: rather than building
+    a new one for each render, call refresh() to bring it up to date.
     """
-    def __init__(self, app):
+    def __init__(self, app, metrics=None):
         self._root = self
         self._app = app
         super().__init__(self, {})
+        # Replaced for each render by ReleaseDashboard.get_release_status()
+        self.metrics = metrics or RenderMetrics()
         self._tiers = {}
+        # Builder objects that survived the last refresh, by builderid
+        self._kept_builders = {}
+        # Highest `complete_at` of the builds in build_infos
+        self._complete_at_watermark = None
+        # Change infos looked up by prefetch_changes(), by buildid
+        self._changes = {}
+        # Builders whose whole history is in build_infos
+        self._complete_histories = set()
+
+    def refresh(self):
+        """Bring the state up to date for a new render
+
+        Only builds that completed since the last refresh are fetched.
+        Builders that didn't get a new build, and whose workers didn't
+        (dis)connect, are kept along with all their computed info.
+        So are branches that only contain such builders.
+        Everything else is discarded, to be recomputed on demand.
+        """
+        old_builders = {b["builderid"]: b for b in self.builders}
+        old_worker_index = self.worker_index
+        old_build_infos = self.build_infos
+        old_branch_info = self._branch_info
+        for name in ('workers', 'worker_index', 'active_builderids',
+                     'builders', 'now', '_branch_info'):
+            self.__dict__.pop(name, None)
+        self._changes = {}
+
+        if self._branch_info != old_branch_info:
+            # Every builder's `branch` is stale. Start (almost) from scratch.
+            for name in ('branches', '_no_branch'):
+                self.__dict__.pop(name, None)
+            old_builders = {}
+
+        new_infos = {}
+        known_builderids = self.active_builderids & old_build_infos.keys()
+        if known_builderids and self._complete_at_watermark is not None:
+            # Builds can complete in the same second as the watermark;
+            # fetch those again and skip the ones we already have.
+            new_infos = self._fetch_build_infos(
+                known_builderids,
+                Filter("complete_at", "ge", [self._complete_at_watermark]),
+            )
+        fresh_builderids = self.active_builderids - old_build_infos.keys()
+        if fresh_builderids:
+            new_infos.update(self._fetch_build_infos(
+                fresh_builderids, per_builder=N_FIRST_BUILDS,
+            ))
+
+        build_infos = {}
+        changed_builderids = set(fresh_builderids)
+        for builderid in self.active_builderids:
+            old_infos = old_build_infos.get(builderid, [])
+            old_buildids = {info["buildid"] for info in old_infos}
+            added = [
+                info for info in new_infos.get(builderid, ())
+                if info["buildid"] not in old_buildids
+            ]
+            if added:
+                changed_builderids.add(builderid)
+            build_infos[builderid] = (added + old_infos)[:N_BUILDS]
+        self._fetch_problem_histories(build_infos, changed_builderids)
+        self.build_infos = build_infos
+        self._update_watermark()
+
+        self._kept_builders = {}
+        for builderid, builder in old_builders.items():
+            if builderid in changed_builderids:
+                continue
+            connected = self._get_builder_workers(builderid).connected_ids
+            old_entry = old_worker_index.get(builderid)
+            if not old_entry or connected != old_entry.connected_ids:
+                continue
+            if not connected:
+                # Disconnected builders show how long ago they last built,
+                # which changes even without new builds.
+                continue
+            self._kept_builders[builderid] = builder
+
+        for branch in [*self.branches, self._no_branch]:
+            old_members = branch.__dict__.get('builders')
+            new_members = [
+                builder for builder in sorted(self.builders)
+                if builder.branch == branch
+            ]
+            if old_members is None or list(map(id, old_members)) != list(
+                map(id, new_members)
+            ):
+                for name in ('builders', 'problems', 'featured_problem',
+                             'digest'):
+                    branch.__dict__.pop(name, None)
+
+    def prefetch_changes(self, builds):
+        """Look up the changes of several builds at once, for Build.changes
+
+        A build's changes are the ones since the previous successful build
+        of its builder. So, builds of the same sourcestamps whose builders
+        last succeeded on the same sourcestamps have the same changes.
+        That's common, since most builders build the same commits.
+        Only one build of each such group is queried.
+        """
+        builds = [
+            build for build in builds
+            if 'changes' not in build.__dict__
+            and build["buildid"] not in self._changes
+        ]
+        if not builds:
+            return
+        previous = {
+            build["buildid"]: build.builder.get_previous_success(build)
+            for build in builds
+        }
+        sourcestamps = self._get_sourcestamp_ids([
+            *builds, *(b for b in previous.values() if b is not None)
+        ])
+
+        groups = {}
+        for build in builds:
+            key = None
+            previous_build = previous[build["buildid"]]
+            if previous_build is not None:
+                key = (
+                    sourcestamps.get(build["buildrequestid"]),
+                    sourcestamps.get(previous_build["buildrequestid"]),
+                )
+            if key is None or None in key:
+                # Previous success (or sourcestamps) unknown; don't share
+                key = build["buildid"]
+            groups.setdefault(key, []).append(build)
+
+        for group in groups.values():
+            infos = self.dataGet(
+                ("builds", group[0]["buildid"], "changes"),
+                limit=MAX_CHANGES,
+            )
+            for build in group:
+                self._changes[build["buildid"]] = infos
+
+    def _get_sourcestamp_ids(self, builds):
+        """Map buildrequestids of the given builds to tuples of their ssids
+        """
+        requestids = sorted({build["buildrequestid"] for build in builds})
+        buildrequests = self.dataGet(
+            ("buildrequests",),
+            filters=[Filter("buildrequestid", "eq", requestids)],
+        )
+        bsids = sorted({info["buildsetid"] for info in buildrequests})
+        buildsets = self.dataGet(
+            ("buildsets",),
+            filters=[Filter("bsid", "eq", bsids)],
+        )
+        ssids = {
+            info["bsid"]: tuple(sorted(
+                ss["ssid"] for ss in info["sourcestamps"]
+            ))
+            for info in buildsets
+        }
+        return {
+            info["buildrequestid"]: ssids.get(info["buildsetid"])
+            for info in buildrequests
+        }
 
     @cached_property
-    def builders(self):
-        active_builderids = set()
+    def worker_index(self):
+        """Map builderid to the BuilderWorkers of the builder
+
+        Built in a single pass over all workers, so that builders don't
+        need to scan the workers themselves.
+        Only builders with at least one configured worker are included.
+        """
+        index = {}
         for worker in self.workers:
             for cnf in worker["configured_on"]:
-                active_builderids.add(cnf["builderid"])
-        return [
-            Builder(self, info)
-            for info in self.dataGet("/builders")
-            if info["builderid"] in active_builderids
+                entry = index.get(cnf["builderid"])
+                if entry is None:
+                    entry = index[cnf["builderid"]] = BuilderWorkers()
+                entry.add(worker)
+        return index
+
+    def _get_builder_workers(self, builderid):
+        try:
+            return self.worker_index[builderid]
+        except KeyError:
+            return BuilderWorkers()
+
+    @cached_property
+    def active_builderids(self):
+        return set(self.worker_index)
+
+    @cached_property
+    def builders(self):
+        builders = []
+        for info in self.dataGet("/builders"):
+            if info["builderid"] not in self.active_builderids:
+                continue
+            builder = self._kept_builders.get(info["builderid"])
+            if builder is None or builder._info != info:
+                builder = Builder(self, info)
+            builders.append(builder)
+        return builders
+
+    @cached_property
+    def build_infos(self):
+        """Recent completed builds of all active builders, keyed by builderid
+        """
+        build_infos = self._fetch_build_infos(
+            self.active_builderids, per_builder=N_FIRST_BUILDS,
+        )
+        self._fetch_problem_histories(build_infos, self.active_builderids)
+        self.build_infos = build_infos
+        self._update_watermark()
+        return build_infos
+
+    def _update_watermark(self):
+        for infos in self.build_infos.values():
+            for info in infos:
+                complete_at = info["complete_at"]
+                if isinstance(complete_at, datetime.datetime):
+                    complete_at = int(complete_at.timestamp())
+                if (
+                    self._complete_at_watermark is None
+                    or complete_at > self._complete_at_watermark
+                ):
+                    self._complete_at_watermark = complete_at
+                # Lists are sorted newest first
+                break
+
+    def _fetch_build_infos(self, builderids, *filters, per_builder=N_BUILDS):
+        """Fetch recent completed builds of the given builders
+
+        Rather than asking for *per_builder* builds of each builder
+        separately, page through the builds of all the builders at once,
+        newest first. Each page only asks for the builders that don't have
+        their *per_builder* builds yet, so builders that build often don't
+        crowd out the others.
+        Builders whose history runs out are added to _complete_histories
+        (unless *filters* leave out some of their builds).
+        """
+        builderids = sorted(builderids)
+        result = {builderid: [] for builderid in builderids}
+        seen_buildids = set()
+        incomplete = set(builderids)
+        # Pages are delimited by completion time, rather than by offset,
+        # since each page asks for different builders
+        cursor = []
+        while incomplete:
+            infos = self.dataGet(
+                ("builds",),
+                limit=BUILDS_PAGE_SIZE,
+                order=["-complete_at"],
+                filters=[
+                    Filter("complete", "eq", ["True"]),
+                    Filter("builderid", "eq", sorted(incomplete)),
+                    *filters,
+                    *cursor,
+                ],
+            )
+            new_builds = False
+            for info in infos:
+                # Builds that completed in the same second as the last page's
+                # oldest one are fetched again; don't list them twice.
+                if info["buildid"] in seen_buildids:
+                    continue
+                seen_buildids.add(info["buildid"])
+                new_builds = True
+                builds = result[info["builderid"]]
+                if len(builds) < per_builder:
+                    builds.append(info)
+                if len(builds) >= per_builder:
+                    incomplete.discard(info["builderid"])
+            if len(infos) < BUILDS_PAGE_SIZE:
+                if not filters:
+                    self._complete_histories.update(incomplete)
+                break
+            oldest = get_timestamp(infos[-1]["complete_at"])
+            # (If a whole page completed in the same second, skip the rest
+            # of that second rather than fetch the same page forever.)
+            op = "le" if new_builds else "lt"
+            cursor = [Filter("complete_at", op, [oldest])]
+        return result
+
+    def _fetch_problem_histories(self, build_infos, builderids):
+        """Fetch the builds that builders with problems show, all at once
+
+        Builders start with N_FIRST_BUILDS builds. Those that (judging by
+        their latest builds and workers) have problems show N_PROBLEM_BUILDS,
+        and one more tells whether there are more: fetch those in one go,
+        rather than builder by builder as the page is rendered.
+        """
+        needed = N_PROBLEM_BUILDS + 1
+        builderids = [
+            builderid for builderid in builderids
+            if len(build_infos.get(builderid, ())) < needed
+            and builderid not in self._complete_histories
+            and self._may_have_problems(builderid, build_infos[builderid])
         ]
+        if builderids:
+            build_infos.update(
+                self._fetch_build_infos(builderids, per_builder=needed)
+            )
+
+    def _may_have_problems(self, builderid, infos):
+        # Like Builder.problems, from the builds we have
+        if not self._get_builder_workers(builderid).connected:
+            return True
+        for info in infos:
+            if info["results"] in (
+                buildbot.process.results.SUCCESS,
+                buildbot.process.results.WARNINGS,
+                buildbot.process.results.FAILURE,
+            ):
+                return info["results"] != buildbot.process.results.SUCCESS
+        return True
 
     @cached_property
     def workers(self):
         return [Worker(self, info) for info in self.dataGet("/workers")]
 
+    @cached_property
+    def _branch_info(self):
+        return self._app.branch_info
+
     @cached_property
     def branches(self):
         branches = []
-        for version, info in self._app.branch_info.items():
+        for version, info in self._branch_info.items():
             if info['status'] == 'end-of-life':
                 continue
             if info['branch'] == 'main':
@@ -164,17 +557,66 @@ def cached_sorted_property(func=None, /, **sort_kwargs):
 class Builder(DashboardObject):
     @cached_property
     def builds(self):
-        endpoint = ("builders", self["builderid"], "builds")
-        infos = self.dataGet(
-            endpoint,
-            limit=N_BUILDS,
+        """The builds fetched so far, newest first
+
+        To go further back in history, use iter_builds().
+        """
+        infos = self._root.build_infos.get(self["builderid"], ())
+        return [Build(self, info) for info in infos]
+
+    def iter_builds(self, prefetch=None):
+        """Yield builds, newest first, fetching older ones as needed
+
+        If the caller knows it'll need *prefetch* builds, they're fetched
+        in one page up front.
+        """
+        if prefetch is not None and len(self.builds) < prefetch:
+            self._fetch_more_builds(prefetch)
+        index = 0
+        while True:
+            while index < len(self.builds):
+                yield self.builds[index]
+                index += 1
+            if not self._fetch_more_builds():
+                return
+
+    def _fetch_more_builds(self, needed=None):
+        """Fetch a page of older builds; return false if there were none
+
+        The page brings the builds fetched so far to *needed*, and at least
+        to as many as problem builders show (and one more, which tells
+        whether there are more). Further pages get bigger as we go further
+        back: a builder that needs an older build often needs a lot of them.
+        """
+        builderid = self["builderid"]
+        infos = self._root.build_infos.setdefault(builderid, [])
+        if builderid in self._root._complete_histories:
+            return False
+        if len(infos) >= N_BUILDS:
+            return False
+        total = max(needed or 0, N_PROBLEM_BUILDS + 1, 2 * len(infos))
+        limit = min(total, N_BUILDS) - len(infos)
+        new_infos = self.dataGet(
+            ("builders", builderid, "builds"),
+            limit=limit,
+            offset=len(infos),
             order=["-complete_at"],
             filters=[Filter("complete", "eq", ["True"])],
         )
-        builds = []
-        for info in infos:
-            builds.append(Build(self, info))
-        return [Build(self, info) for info in infos]
+        if len(new_infos) < limit:
+            self._root._complete_histories.add(builderid)
+        # A build that completed since we got the first page shifts
+        # the offsets; don't list the same build twice.
+        known_buildids = {info["buildid"] for info in infos}
+        fetched = False
+        for info in new_infos:
+            if info["buildid"] not in known_buildids:
+                infos.append(info)
+                # get_build() may have looked it up already
+                build = self._other_builds.pop(info["buildid"], None)
+                self.builds.append(build or Build(self, info))
+                fetched = True
+        return fetched
 
     @cached_property
     def tags(self):
@@ -205,9 +647,154 @@ class Builder(DashboardObject):
     def __lt__(self, other):
         return self["name"] < other["name"]
 
+    def get_previous_success(self, build):
+        """Get the latest successful build before *build*, if any
+
+        Only the last N_BUILDS builds are searched, except for the latest
+        build and the start of the current failure streak, which the streak
+        knows about.
+        """
+        streak = self.streak
+        if (
+            streak is not None
+            and build["buildid"] in (streak.start_buildid, streak.last_buildid)
+            and build["results"] != buildbot.process.results.SUCCESS
+        ):
+            if streak.last_success_buildid is None:
+                return None
+            return self.get_build(streak.last_success_buildid)
+        for other in self.iter_builds():
+            if (
+                other["number"] < build["number"]
+                and other["results"] == buildbot.process.results.SUCCESS
+            ):
+                return other
+        return None
+
+    def get_build(self, buildid):
+        """Get a build of this builder by ID (None if it doesn't exist)"""
+        for build in self.builds:
+            if build["buildid"] == buildid:
+                return build
+        if buildid not in self._other_builds:
+            info = self.dataGet(("builds", buildid))
+            self._other_builds[buildid] = info and Build(self, info)
+        return self._other_builds[buildid]
+
+    @cached_property
+    def _other_builds(self):
+        # Builds outside self.builds looked up by get_build(), by buildid
+        return {}
+
+    @cached_property
+    def streak(self):
+        """The builder's failure Streak, up to date with its latest build
+
+        None if the builder has no builds.
+        """
+        table = self._root._app.failure_streaks
+        streak = table.get(self["builderid"])
+        if streak is not None:
+            new_builds = []
+            for build in self.iter_builds():
+                if streak.is_processed(build):
+                    break
+                new_builds.append(build)
+            else:
+                # More than N_BUILDS new builds (or the history changed);
+                # start over
+                streak = None
+            if streak is not None and not new_builds:
+                return streak
+        if streak is None:
+            streak = self._find_streak()
+            if streak is None:
+                return None
+        else:
+            streak.advance(new_builds)
+        table.put(streak)
+        return streak
+
+    def _find_streak(self):
+        """Find the builder's current Streak
+
+        Usually from the builds we have: builders with problems have
+        the N_PROBLEM_BUILDS they show. If the last successful build is
+        older than those, search the whole history: that's two queries,
+        for the last successful build and for the first failed one after it.
+        """
+        latest_build = next(self.iter_builds(), None)
+        if latest_build is None:
+            return None
+        known_builds = None
+        for index, build in enumerate(self.builds):
+            if build["results"] == buildbot.process.results.SUCCESS:
+                known_builds = self.builds[:index + 1]
+                break
+        else:
+            if (
+                self["builderid"] in self._root._complete_histories
+                and len(self.builds) < N_BUILDS
+            ):
+                known_builds = self.builds
+        if known_builds is not None:
+            streak = Streak(
+                builderid=self["builderid"],
+                last_complete_at=0,
+                last_buildid=0,
+                last_success_buildid=None,
+                start_buildid=None,
+            )
+            streak.advance(known_builds)
+            return streak
+        latest_complete_at = get_timestamp(latest_build["complete_at"])
+
+        def get_one_build(order, results, *filters):
+            return self.dataGet(
+                ("builders", self["builderid"], "builds"),
+                limit=1,
+                order=[order],
+                filters=[
+                    Filter("complete", "eq", ["True"]),
+                    Filter("complete_at", "le", [latest_complete_at]),
+                    Filter("results", "eq", [results]),
+                    *filters,
+                ],
+            )
+
+        successes = get_one_build(
+            "-complete_at", buildbot.process.results.SUCCESS,
+        )
+        failures = get_one_build(
+            "complete_at", buildbot.process.results.FAILURE,
+            *[
+                Filter("complete_at", "gt", [get_timestamp(info["complete_at"])])
+                for info in successes
+            ],
+        )
+        return Streak(
+            builderid=self["builderid"],
+            last_complete_at=latest_complete_at,
+            last_buildid=latest_build["buildid"],
+            last_success_buildid=(
+                successes[0]["buildid"] if successes else None
+            ),
+            start_buildid=failures[0]["buildid"] if failures else None,
+        )
+
+    @cached_property
+    def first_failing_build(self):
+        """The first failed build since the last successful one
+
+        None if it's not known (or the builder isn't failing).
+        """
+        if self.streak is None or self.streak.start_buildid is None:
+            return None
+        return self.get_build(self.streak.start_buildid)
+
     def iter_interesting_builds(self):
         """Yield builds except unfinished/skipped/interrupted ones"""
-        for build in self.builds:
+        for build in self.iter_builds():
             if build["results"] in (
                 buildbot.process.results.SUCCESS,
                 buildbot.process.results.WARNINGS,
@@ -228,32 +815,58 @@ class Builder(DashboardObject):
         elif latest_build["results"] == buildbot.process.results.WARNINGS:
             yield BuildWarning(latest_build)
         elif latest_build["results"] == buildbot.process.results.FAILURE:
-            first_failing_build = None
-            for build in self.iter_interesting_builds():
-                if build["results"] == buildbot.process.results.FAILURE:
-                    first_failing_build = build
-                elif build["results"] == buildbot.process.results.SUCCESS:
-                    break
-            else:
-                # Didn't find a successful build; end of the failing streak
-                # is unknown.
-                first_failing_build = None
-            yield BuildFailure(latest_build, first_failing_build)
+            yield BuildFailure(latest_build, self.first_failing_build)
 
         if not self.connected_workers:
             yield BuilderDisconnected(self)
 
-    @cached_sorted_property
+    def as_dict(self):
+        return {
+            'builderid': self["builderid"],
+            'name': self["name"],
+            'tags': sorted(self.tags),
+            'tier': self.tier.tag,
+            'is_stable': self.is_stable,
+            'connected': bool(self.connected_workers),
+        }
+
+    @cached_property
+    def configured_workers(self):
+        return self._root._get_builder_workers(self["builderid"]).configured
+
+    @cached_property
     def connected_workers(self):
-        for worker in self._root.workers:
-            if worker["connected_to"]:
-                for cnf in worker["configured_on"]:
-                    if cnf["builderid"] == self["builderid"]:
-                        yield worker
+        return self._root._get_builder_workers(self["builderid"]).connected
 
 class Worker(DashboardObject):
     pass  # The JSON is fine! :)
 
+
+@dataclass
+class BuilderWorkers:
+    """Workers configured for a builder, and the connected ones among them
+
+    Both lists are sorted by name.
+    """
+    configured: list = field(default_factory=list)
+    connected: list = field(default_factory=list)
+
+    def add(self, worker):
+        # A worker can be configured on the builder on several masters
+        if any(w is worker for w in self.configured):
+            return
+        bisect.insort(self.configured, worker, key=_get_name)
+        if worker["connected_to"]:
+            bisect.insort(self.connected, worker, key=_get_name)
+
+    @property
+    def connected_ids(self):
+        return {worker["workerid"] for worker in self.connected}
+
+
+def _get_name(obj):
+    return obj["name"]
+
 @total_ordering
 class _BranchTierBase(DashboardObject):
     """Base class for Branch and Tag"""
@@ -330,6 +943,58 @@ class Branch(_BranchTierBase):
         for d, problems in itertools.groupby(self.problems, key):
             yield d, list(problems)
 
+    def as_dict(self):
+        severity = self.featured_problem.severity
+        return {
+            **self._info,
+            'title': self.title,
+            'severity': severity.name,
+            'releasability': severity.releasability,
+            'problems': [
+                problem.as_dict() for problem in self.problems
+                if not isinstance(problem, NoProblem)
+            ],
+        }
+
+    def as_summary(self):
+        """A short version of as_dict(), for /api/events
+
+        The digest changes when the branch's section of the page does.
+        """
+        severity = self.featured_problem.severity
+        return {
+            'tag': self.tag,
+            'severity': severity.name,
+            'releasability': severity.releasability,
+            'digest': self.digest,
+        }
+
+    def iter_affected_builds(self):
+        """Yield the builds whose details the branch's section shows"""
+        for problem in self.problems:
+            yield from problem.affected_builds.values()
+
+    @cached_property
+    def digest(self):
+        """Digest of the data the branch's section of the page is made from
+
+        That is the branch info, and each builder's info, latest build
+        and connected workers.
+        """
+        parts = [self._info]
+        for builder in self.builders:
+            latest_buildid = None
+            for build in builder.iter_builds():
+                latest_buildid = build["buildid"]
+                break
+            parts.append([
+                builder._info,
+                latest_buildid,
+                sorted(w["workerid"] for w in builder.connected_workers),
+            ])
+        data = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
 
 class Tier(_BranchTierBase):
     @cached_property
@@ -353,6 +1018,13 @@ class Tier(_BranchTierBase):
     def is_release_blocking(self):
         return self.value in {1, 2}
 
+    def as_dict(self):
+        return {
+            'tag': self.tag,
+            'title': self.title,
+            'is_release_blocking': self.is_release_blocking,
+        }
+
 
 class Build(DashboardObject):
     @cached_property
@@ -362,10 +1034,13 @@ class Build(DashboardObject):
 
     @cached_property
     def changes(self):
-        infos = self.dataGet(
-            ("builds", self["buildid"], "changes"),
-            limit=MAX_CHANGES,
-        )
+        try:
+            infos = self._root._changes[self["buildid"]]
+        except KeyError:
+            infos = self.dataGet(
+                ("builds", self["buildid"], "changes"),
+                limit=MAX_CHANGES,
+            )
         if len(infos) == MAX_CHANGES:
             # Buildbot lists changes since the last *successful* build,
             # so in a failing streak the list can get very big.
@@ -441,22 +1116,33 @@ class Build(DashboardObject):
             if not filepath.is_file():
                 return None
 
-            with filepath.open() as file:
-                etree = ElementTree.parse(file)
+            summary = self._root._app.junit_cache.get(filepath)
 
         # We don't have a logger set up, this returns None on common failures
         # (meaning failures won't show on the dashboard).
         # TODO: set up monitoring and log failures (in the whole method).
         except OSError as e:
             return None
-        except ElementTree.ParseError as e:
+
+        if summary is None:
+            # Not valid XML
             return None
 
         result = JunitResult(self, {})
-        for element in etree.iterfind('.//error/..'):
-            result.add(element)
+        for name, errors in summary:
+            result.add(name, errors)
         return result
 
+    def as_dict(self):
+        return {
+            'buildid': self["buildid"],
+            'builderid': self["builderid"],
+            'number': self["number"],
+            'results': self.results_string,
+            'started_at': _isoformat(self.started_at),
+            'complete_at': _isoformat(self["complete_at"]),
+        }
+
     @cached_property
     def duration(self):
         try:
@@ -477,8 +1163,8 @@ class JunitResult(DashboardObject):
         self.errors = []
         self.error_types = set()
 
-    def add(self, element):
-        """Add errors from a XML element.
+    def add(self, name, errors):
+        """Add errors of a test (see junit_utils.iter_junit_errors).
 
         JunitResult are arranged in a tree, grouped by test modules, classes
         and methods (i.e. dot-separated parts of the test name).
@@ -491,23 +1177,16 @@ class JunitResult(DashboardObject):
         if the details of a test module/class/methods aren't expanded,
         the dashboard shows exception types from all the hidden failures.
         """
-        # Gather all the errors (as dicts), and their exception types
-        # (as strings), from *element*.
-        # Usually there's only one error per element.
-        errors = []
-        error_types = set()
-        for error_elem in element.iterfind('error'):
-            new_error = JunitError(self, {
-                **error_elem.attrib,
-                'text': error_elem.text,
-            })
-            errors.append(new_error)
-            error_types.add(new_error["type"])
+        # Wrap all the errors, and gather their exception types
+        # (as strings).
+        # Usually there's only one error per test.
+        errors = [JunitError(self, info) for info in errors]
+        error_types = {error["type"] for error in errors}
 
         # Find/add the leaf JunitResult, updating result.error_types for each
         # Result along the way
         result = self
-        name_parts = element.attrib.get('name', '??').split('.')
+        name_parts = name.split('.')
         if name_parts[0] == 'test':
             name_parts.pop(0)
         for part in name_parts:
@@ -523,6 +1202,32 @@ class JunitResult(DashboardObject):
                 result.errors.extend(errors)
 
 
+    @property
+    def error_count(self):
+        """Number of (de-duplicated) errors in this part of the tree"""
+        return len(self.errors) + sum(
+            child.error_count for child in self.contents.values()
+        )
+
+    def find(self, path):
+        """Get the sub-result for a dotted name, or None"""
+        result = self
+        for part in path.split('.'):
+            result = result.contents.get(part)
+            if result is None:
+                return None
+        return result
+
+    def as_dict(self):
+        return {
+            'error_types': sorted(self.error_types),
+            'errors': [error._info for error in self.errors],
+            'contents': {
+                name: child.as_dict() for name, child in self.contents.items()
+            },
+        }
+
+
 class JunitError(DashboardObject):
     def __eq__(self, other):
         return self._info == other._info
@@ -612,6 +1317,28 @@ class Problem:
     def affected_builds(self):
         return {}
 
+    def as_dict(self):
+        builder = getattr(self, 'builder', None)
+        return {
+            'description': self.description,
+            'severity': self.severity.name,
+            'builder': builder.as_dict() if builder else None,
+            'affected_builds': {
+                label: build.as_dict()
+                for label, build in self.affected_builds.items()
+            },
+        }
+
+
+def _isoformat(timestamp):
+    if timestamp is None:
+        return None
+    if not isinstance(timestamp, datetime.datetime):
+        timestamp = datetime.datetime.fromtimestamp(
+            timestamp, tz=datetime.timezone.utc,
+        )
+    return timestamp.isoformat()
+
 
 @dataclass
 class BuildFailure(Problem):
@@ -713,37 +1440,722 @@ class NoBuilds(Problem):
     severity = Severity.NO_INFO
 
 
+class BranchInfoProvider:
+    """Release cycle info (BRANCHES_URL), refreshed in the background
+
+    The last good copy is saved to *cache_path* (if given) and used at
+    startup, so loading the master config doesn't need the network.
+    After *ttl* seconds, the next get() starts a refresh in a background
+    thread and returns the copy it has. Refreshes are conditional requests
+    (If-None-Match/If-Modified-Since), so usually nothing is downloaded.
+    """
+    def __init__(self, url=BRANCHES_URL, cache_path=None,
+                 ttl=BRANCH_INFO_TTL):
+        self.url = url
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._info = None
+        self._etag = None
+        self._last_modified = None
+        self._checked_at = None
+        self._refreshing = False
+        self._refreshed = threading.Condition(self._lock)
+        if cache_path is not None:
+            with contextlib.suppress(OSError, ValueError, KeyError):
+                self._load(cache_path)
+        if self._info is None:
+            self._start_refresh()
+
+    def get(self):
+        """Return the branch info
+
+        If there's no copy yet, fetch it (and raise if that fails).
+        """
+        with self._lock:
+            if self._info is None:
+                while self._refreshing:
+                    self._refreshed.wait()
+            info = self._info
+            if info is not None and (
+                self._checked_at is None
+                or time.monotonic() - self._checked_at > self.ttl
+            ):
+                self._start_refresh()
+        if info is None:
+            self.refresh()
+            info = self._info
+        return info
+
+    def refresh(self):
+        """Fetch the info if it changed, and save it"""
+        request = urllib.request.Request(self.url)
+        if self._etag:
+            request.add_header('If-None-Match', self._etag)
+        if self._last_modified:
+            request.add_header('If-Modified-Since', self._last_modified)
+        try:
+            with urllib.request.urlopen(
+                request, timeout=BRANCH_INFO_TIMEOUT,
+            ) as response:
+                info = json.load(response)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except urllib.error.HTTPError as e:
+            if e.code != 304 or self._info is None:
+                raise
+            # Not Modified
+            with self._lock:
+                self._checked_at = time.monotonic()
+            return
+        with self._lock:
+            self._info = info
+            self._etag = etag
+            self._last_modified = last_modified
+            self._checked_at = time.monotonic()
+        if self.cache_path is not None:
+            self._save(self.cache_path)
+
+    def _start_refresh(self):
+        # Must be called with the lock held (or before other threads can
+        # see the provider)
+        if self._refreshing:
+            return
+        self._refreshing = True
+        thread = threading.Thread(
+            target=self._background_refresh,
+            name='release-dashboard-branch-info', daemon=True,
+        )
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except (OSError, ValueError):
+            # Keep the copy we have; try again later.
+            # (URLError is an OSError, invalid JSON is a ValueError.)
+            with self._lock:
+                self._checked_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._refreshed.notify_all()
+
+    def _load(self, path):
+        with open(path, encoding='utf-8') as file:
+            saved = json.load(file)
+        self._info = saved['info']
+        self._etag = saved.get('etag')
+        self._last_modified = saved.get('last_modified')
+
+    def _save(self, path):
+        with self._lock:
+            saved = {
+                'info': self._info,
+                'etag': self._etag,
+                'last_modified': self._last_modified,
+            }
+        # Write to a temporary file and rename it, so a crash can't leave
+        # a truncated copy behind.
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(saved, file)
+        os.replace(tmp_path, path)
+
+
+def _gzip_stream(chunks):
+    """gzip-compress an iterable of bytes, flushing after each chunk"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+# Counters of RenderMetrics, with their descriptions
+_METRIC_HELP = {
+    'dataget_calls': 'Buildbot data API calls',
+    'dataget_rows': 'Rows (items) returned by Buildbot data API calls',
+    'dataget_seconds': 'Time spent in Buildbot data API calls',
+    'junit_files_parsed': 'JUnit XML files parsed (not found in the cache)',
+    'junit_bytes_parsed': 'Size of the JUnit XML files parsed',
+    'sections_rendered': 'Branch sections rendered (not reused from cache)',
+    'html_bytes': 'Size of the HTML page',
+    'status_bytes': 'Size of the status JSON',
+}
+
+
+class RenderMetrics:
+    """Timings and counters for one generation of the dashboard
+
+    Phases are the main steps of ReleaseDashboard.get_release_status().
+    They can nest; time spent in a nested phase only counts for that one.
+    Data API calls happen in several phases; their time is also counted
+    separately, as "dataget_seconds".
+    """
+    def __init__(self):
+        self.phase_seconds = {}
+        self.counters = dict.fromkeys(_METRIC_HELP, 0)
+        # For each running phase, time spent in phases nested in it
+        self._nested_seconds = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self._nested_seconds.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested_seconds.pop()
+            self.phase_seconds[name] = (
+                self.phase_seconds.get(name, 0) + elapsed - nested
+            )
+            if self._nested_seconds:
+                self._nested_seconds[-1] += elapsed
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def summary(self):
+        """Return a one-line summary, for humans"""
+        total = sum(self.phase_seconds.values())
+        phases = ', '.join(
+            f'{name} {seconds:.3f}s'
+            for name, seconds in self.phase_seconds.items()
+        )
+        c = self.counters
+        return (
+            f'generated in {total:.3f}s ({phases}); '
+            + f'{c["dataget_calls"]} data API calls, '
+            + f'{c["dataget_rows"]} rows, {c["dataget_seconds"]:.3f}s; '
+            + f'{c["junit_files_parsed"]} JUnit files parsed, '
+            + f'{c["junit_bytes_parsed"]} bytes; '
+            + f'{c["sections_rendered"]} branch sections rendered'
+        )
+
+    def as_prometheus(self, prefix='release_dashboard_'):
+        """Return the metrics in Prometheus text exposition format"""
+        lines = [
+            f'# HELP {prefix}phase_seconds'
+            + ' Time spent in each phase of the last generation',
+            f'# TYPE {prefix}phase_seconds gauge',
+        ]
+        for name, seconds in self.phase_seconds.items():
+            lines.append(f'{prefix}phase_seconds{{phase="{name}"}} {seconds}')
+        for name, value in self.counters.items():
+            lines.extend([
+                f'# HELP {prefix}{name} {_METRIC_HELP[name]}'
+                + ' (last generation)',
+                f'# TYPE {prefix}{name} gauge',
+                f'{prefix}{name} {value}',
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+class StreamedOutput:
+    """Text written by a generation, readable while it's being written
+
+    Iterating gives the text from the start, in chunks as they're flushed,
+    until the output is closed -- then it raises the generation's exception,
+    if any. write() and flush() must be called from one thread; iterating
+    can be done from any number of others.
+    """
+    def __init__(self, chunk_size=16 * 1024):
+        self._chunk_size = chunk_size
+        self._buffer = []
+        self._buffered_size = 0
+        self._chunks = []
+        self._closed = False
+        self._error = None
+        self._changed = threading.Condition()
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._buffered_size += len(text)
+        if self._buffered_size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Make the text written so far available to readers"""
+        if not self._buffer:
+            return
+        chunk = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered_size = 0
+        with self._changed:
+            self._chunks.append(chunk)
+            self._changed.notify_all()
+
+    def getvalue(self):
+        """Return all the text written so far (must be called by the writer)
+        """
+        self.flush()
+        return ''.join(self._chunks)
+
+    def close(self, error=None):
+        if error is None:
+            self.flush()
+        with self._changed:
+            self._closed = True
+            self._error = error
+            self._changed.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._changed:
+                while position == len(self._chunks) and not self._closed:
+                    self._changed.wait()
+                chunks = self._chunks[position:]
+                position = len(self._chunks)
+                closed = self._closed
+                error = self._error
+            yield from chunks
+            if closed:
+                if error is not None:
+                    raise error
+                return
+
+
+class PageCache:
+    """The last generated page, served even when stale
+
+    Only one generation runs at a time, in a background thread.
+    Requests that come in while it runs get the previous result right away;
+    only requests that can't do with it (there's no result yet, or
+    a refresh was forced) wait -- for the generation that's already running,
+    if any -- or stream its output (see stream()).
+
+    After each generation, another one is scheduled in *refresh_interval*,
+    to keep the cache warm; invalidate() schedules one sooner.
+    Failed generations are retried after RENDER_RETRY_DELAY, backing off.
+    stop() ends this background work, and close() the store.
+
+    The result is kept in a *store* (see custom.render_store); by default,
+    in this process. Processes that share a store also share generations:
+    one that needs a new result uses another's if it's recent enough,
+    and waits for it if it's being generated (see _generate_or_wait()).
+    """
+    def __init__(self, generate, max_age=CACHE_DURATION,
+                 refresh_interval=REFRESH_INTERVAL, store=None, replay=None):
+        # generate(environ, output) is called with the WSGI environ of
+        # a request (the last one we got, for scheduled refreshes), and
+        # a StreamedOutput to write the page to as it's generated
+        self._generate = generate
+        # replay(result, output) writes a result that another process
+        # generated, for requests that stream the output
+        self._replay = replay
+        self._store = store if store is not None else MemoryRenderStore()
+        # Identifies us to the store's lease
+        self._owner = uuid.uuid4().hex
+        # These can be changed; they apply from the next generation
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._result = None
+        self._version = None
+        # time.time() when the generation of the result started
+        self._generated_at = None
+        self._error = None
+        # Generations that failed in a row
+        self._failures = 0
+        self._running = False
+        self._runs = 0
+        self._environ = None
+        self._output = None
+        self._timer = None
+        self._timer_due = None
+        # The timer's generation can use results generated since then
+        self._timer_needed_since = None
+        # (delay, needed_since) of the generation to schedule after
+        # the running one, if invalidate() was called while it ran
+        self._rerun = None
+        self._stopped = False
+
+    def get(self, environ, wait=False):
+        """Return the cached result and its age in seconds
+
+        If *wait* is true, or there's no result yet, wait for a generation
+        to finish, and raise its exception if it failed.
+        """
+        with self._lock:
+            self._environ = dict(environ)
+            self._load()
+            if self._result is None or wait or self._get_age() > self.max_age:
+                self._start(time.time())
+            if self._result is None or wait:
+                target = self._runs + 1
+                while self._runs < target:
+                    self._finished.wait()
+                if self._error is not None:
+                    raise self._error
+            return self._result, self._get_age()
+
+    def stream(self, environ):
+        """Start a generation, unless one is running, and return its output
+
+        The StreamedOutput can be read as the page is generated; the result
+        is cached as usual.
+        """
+        with self._lock:
+            self._environ = dict(environ)
+            self._start(time.time())
+            return self._output
+
+    def invalidate(self, delay=0):
+        """Schedule a generation in *delay* seconds, unless one is due sooner
+
+        If a generation is running, it may have missed the change that
+        prompted this: the generation is scheduled after it finishes.
+        """
+        with self._lock:
+            now = time.time()
+            if not self._running:
+                self._schedule(delay, now)
+            elif self._rerun is None:
+                self._rerun = delay, now
+            else:
+                self._rerun = min(delay, self._rerun[0]), now
+
+    def peek(self):
+        """Return the cached result, or None if there's none yet
+
+        Unlike get(), this never starts a generation or waits for one.
+        """
+        with self._lock:
+            self._load()
+            return self._result
+
+    def stop(self):
+        """Stop generating in the background
+
+        Scheduled generations are cancelled, and no more are scheduled;
+        requests still start them. This doesn't wait for the lock (a running
+        timer fires, but does nothing), so it can be called from the reactor.
+        """
+        self._stopped = True
+        timer = self._timer
+        if timer is not None:
+            timer.cancel()
+
+    def close(self):
+        """stop(), and close the store once the running generation is done
+
+        This waits for the lock: don't call it from the reactor.
+        """
+        self.stop()
+        with self._lock:
+            while self._running:
+                self._finished.wait()
+            self._store.close()
+
+    @property
+    def age(self):
+        """Age of the result in seconds, or None if there's none yet"""
+        with self._lock:
+            self._load()
+            return self._get_age()
+
+    def _get_age(self):
+        # Must be called with the lock held
+        if self._generated_at is None:
+            return None
+        return max(0, time.time() - self._generated_at)
+
+    def _load(self):
+        # Must be called with the lock held.
+        # Pick up a result that another process stored.
+        loaded = self._store.load(since=self._version)
+        if loaded is not None and (
+            self._generated_at is None or loaded[1] >= self._generated_at
+        ):
+            self._version, self._generated_at, self._result = loaded
+
+    def _start(self, needed_since):
+        # Must be called with the lock held.
+        # The generation can use a result generated since *needed_since*.
+        if self._running:
+            return
+        self._running = True
+        self._output = StreamedOutput()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        thread = threading.Thread(
+            target=self._run,
+            args=(self._environ, self._output, needed_since),
+            name='release-dashboard-generator', daemon=True,
+        )
+        thread.start()
+
+    def _run(self, environ, output, needed_since):
+        loaded = error = None
+        try:
+            loaded = self._generate_or_wait(environ, output, needed_since)
+        except Exception as e:
+            error = e
+        with self._lock:
+            if error is None and (
+                self._generated_at is None or loaded[1] >= self._generated_at
+            ):
+                self._version, self._generated_at, self._result = loaded
+            self._error = error
+            self._running = False
+            self._runs += 1
+            self._finished.notify_all()
+            self._failures = 0 if error is None else self._failures + 1
+            if self._failures:
+                # Back off, rather than retry right away (the page is
+                # usually already due)
+                delay = min(
+                    self.refresh_interval,
+                    RENDER_RETRY_DELAY * 2 ** (self._failures - 1),
+                )
+                if self._rerun is not None:
+                    delay = max(delay, self._rerun[0])
+                    self._rerun = None
+                self._schedule(delay, time.time())
+            elif self._rerun is not None:
+                self._schedule(*self._rerun)
+                self._rerun = None
+            elif self._generated_at is None:
+                self._schedule(self.refresh_interval, time.time())
+            else:
+                # Processes sharing the store take turns
+                self._schedule(
+                    self._generated_at + self.refresh_interval - time.time(),
+                    time.time(),
+                )
+        # Only now: a request that finished reading the output must not
+        # join this generation again, as if it was still running
+        output.close(error)
+
+    def _generate_or_wait(self, environ, output, needed_since):
+        """Return the (version, generated_at, result) of a new result
+
+        If the store has a result generated since *needed_since*, use it.
+        Otherwise generate one -- unless another process (sharing the store)
+        is generating: then wait for its result, and only generate if it
+        doesn't come (because the generation failed).
+        """
+        version = self._version
+        while True:
+            loaded = self._store.load(since=version)
+            if loaded is not None:
+                version, generated_at, result = loaded
+                if generated_at >= needed_since:
+                    if self._replay is not None:
+                        self._replay(result, output)
+                    return loaded
+            if self._store.acquire_lease(self._owner, RENDER_LEASE_DURATION):
+                break
+            if self._stopped:
+                # Don't keep close() waiting for another process
+                raise RuntimeError('The page cache was stopped')
+            time.sleep(RENDER_STORE_POLL_INTERVAL)
+        try:
+            generated_at = time.time()
+            result = self._generate(environ, output)
+            version = self._store.save(generated_at, result)
+        finally:
+            self._store.release_lease(self._owner)
+        return version, generated_at, result
+
+    def _schedule(self, delay, needed_since):
+        # Must be called with the lock held
+        if self._stopped:
+            return
+        delay = max(0, delay)
+        due = time.monotonic() + delay
+        if self._timer is not None:
+            if self._timer_due <= due:
+                self._timer_needed_since = max(
+                    self._timer_needed_since, needed_since,
+                )
+                return
+            needed_since = max(self._timer_needed_since, needed_since)
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._scheduled_refresh)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer_needed_since = needed_since
+        self._timer.start()
+
+    def _scheduled_refresh(self):
+        with self._lock:
+            self._timer = None
+            if not self._stopped:
+                self._start(self._timer_needed_since)
+
+
+def _compress(data):
+    """Return a dict of content-coding -> *data* encoded with it
+
+    The generated page is sent many times, so it's compressed once,
+    as tightly as possible, rather than for each request.
+    """
+    encodings = {
+        'gzip': gzip.compress(data, compresslevel=9, mtime=0),
+        'identity': data,
+    }
+    if brotli is not None:
+        encodings['br'] = brotli.compress(data)
+    return encodings
+
+
+@dataclass
+class Rendering:
+    """The result of generating the dashboard"""
+    html: str
+    # Machine-readable status, and its (strong) ETag
+    status: bytes
+    status_etag: str
+    # content-coding -> encoded body, for html and status
+    html_encodings: dict
+    status_encodings: dict
+    metrics: RenderMetrics
+    # Summaries of the branches (for /api/events), and their ETag.
+    # (With defaults for renderings stored by older versions.)
+    branch_summaries: bytes = b'[]'
+    branch_summaries_etag: str = ''
+
+
 class ReleaseDashboard:
     # This doesn't get recreated for every render.
     # The Flask app and caches go here.
-    def __init__(self, test_result_dir=None):
+    def __init__(self, test_result_dir=None, cache_dir=None,
+                 branches_url=BRANCHES_URL, render_store=None):
         self.flask_app = Flask("test", root_path=os.path.dirname(__file__))
-        self.cache = None
-
-        self._refresh_branch_info()
+        # To share the generated page with other processes, pass
+        # a render_store like custom.render_store.SQLiteRenderStore
+        self.cache = PageCache(
+            self._generate_page,
+            store=render_store,
+            replay=lambda rendering, output: output.write(rendering.html),
+        )
+        self.state = None
+        self._state_lock = threading.Lock()
+        # branch tag -> (digest, time.monotonic() of rendering, HTML)
+        self._branch_sections = {}
+        # mq consumers, once we subscribed to events (see start())
+        self._mq_consumers = []
+        # The reactor's call to invalidate the cache after an event
+        self._master = self._reactor = None
+        self._event_call = None
+        # The LoopingCall that updates the failure history (see start())
+        self._history_updates = None
+        # Deferreds of the running _update_streak() calls
+        self._streak_updates = set()
 
         self.flask_app.jinja_env.add_extension('jinja2.ext.loopcontrols')
         self.flask_app.jinja_env.undefined = jinja2.StrictUndefined
 
         self.test_result_dir = Path(test_result_dir).resolve()
 
+        # Persistent caches go in cache_dir (if not given, keep them in memory)
+        if cache_dir is not None:
+            cache_dir = Path(cache_dir)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.junit_cache = JunitSummaryCache(
+            cache_dir and cache_dir / 'junit_summaries.sqlite'
+        )
+        self.failure_streaks = StreakTable(
+            cache_dir and cache_dir / 'failure_streaks.sqlite'
+        )
+        self.branch_info_provider = BranchInfoProvider(
+            branches_url,
+            cache_path=cache_dir and cache_dir / 'release-cycle.json',
+        )
+        self.failure_history = FailureHistoryIndex(
+            self.test_result_dir,
+            cache_dir and cache_dir / 'failure_history.sqlite',
+        )
+
         @self.flask_app.route('/')
         @self.flask_app.route("/index.html")
         def main():
             force_refresh = request.args.get("refresh", "").lower() in {"1", "yes", "true"}
 
-            if self.cache is not None and not force_refresh:
-                result, deadline = self.cache
-                if time.monotonic() <= deadline:
-                    return result
-
-            with contextlib.suppress(urllib.error.HTTPError):
-                self._refresh_branch_info()
-
-            result = self.get_release_status()
-            deadline = time.monotonic() + CACHE_DURATION
-            self.cache = (result, deadline)
-            return result
+            if force_refresh or self.cache.age is None:
+                # Nothing to serve yet; send the page as it's generated
+                return self._make_streamed_response(
+                    self.cache.stream(request.environ)
+                )
+            rendering, age = self.cache.get(request.environ)
+            response = self._make_encoded_response(rendering.html_encodings)
+            response.content_type = 'text/html; charset=utf-8'
+            response.headers['Age'] = str(int(age))
+            return response
+
+        @self.flask_app.route('/api/status.json')
+        def status_json():
+            # The same data as the HTML page, from the same cache
+            rendering, age = self.cache.get(request.environ)
+            response = self._make_encoded_response(
+                rendering.status_encodings, etag=rendering.status_etag,
+            )
+            response.content_type = 'application/json'
+            response.headers['Age'] = str(int(age))
+            return response.make_conditional(request)
+
+        @self.flask_app.route('/api/events')
+        def events():
+            # A server-sent event with summaries of the branches,
+            # if they changed since the client's last one
+            last_etag = request.headers.get(
+                'Last-Event-ID', request.args.get('since'),
+            )
+            response = self.flask_app.response_class(
+                self._get_events(last_etag),
+                content_type='text/event-stream',
+            )
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        @self.flask_app.route('/metrics')
+        def metrics():
+            rendering, age = self.cache.get(request.environ)
+            text = rendering.metrics.as_prometheus() + (
+                '# HELP release_dashboard_age_seconds'
+                + ' Age of the served page\n'
+                + '# TYPE release_dashboard_age_seconds gauge\n'
+                + f'release_dashboard_age_seconds {age}\n'
+            )
+            response = make_response(text)
+            response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            return response
+
+        @self.flask_app.route('/api/test-history.json')
+        def failure_history_json():
+            # How often a test failed recently, per builder
+            test = request.args.get('test')
+            if not test:
+                abort(400)
+            counts = self.failure_history.get_failure_counts(
+                test,
+                branch=request.args.get('branch', '3.x'),
+                days=request.args.get('days', 30, type=int),
+            )
+            return jsonify(counts)
+
+        @self.flask_app.route('/build/<int:buildid>/junit.json')
+        def junit_json(buildid):
+            junit_results = self._get_junit_results(buildid)
+            return jsonify(junit_results.as_dict())
+
+        @self.flask_app.route('/build/<int:buildid>/junit.html')
+        def junit_details(buildid):
+            # Details of one part of the results, for the main page
+            junit_results = self._get_junit_results(buildid)
+            result = junit_results.find(request.args.get('path', ''))
+            if result is None:
+                abort(404)
+            junit_contents = get_template_attribute(
+                "releasedashboard_junit.html", "junit_contents",
+            )
+            return junit_contents(result)
 
         @self.flask_app.template_filter('first_line')
         def first_line(text):
@@ -770,19 +2182,378 @@ class ReleaseDashboard:
             # When that's no longer true we should put a name in the data.
             return full_name.split()[0]
 
-    def _refresh_branch_info(self):
-        with urllib.request.urlopen(BRANCHES_URL) as file:
-            self.branch_info = json.load(file)
+    def _make_encoded_response(self, encodings, etag=None):
+        """Make a response with the best of *encodings* for the request
 
-    def get_release_status(self):
+        *encodings* is a dict from _compress().
+        """
+        # Preferred first, in case the client likes several equally
+        preferred = [c for c in ('br', 'gzip', 'identity') if c in encodings]
+        coding = request.accept_encodings.best_match(
+            preferred, default='identity',
+        )
+        response = make_response(encodings[coding])
+        if coding != 'identity':
+            response.headers['Content-Encoding'] = coding
+        response.vary.add('Accept-Encoding')
+        if etag is not None:
+            # Each encoding is a different representation, and needs
+            # a different strong ETag
+            if coding != 'identity':
+                etag = f'{etag}-{coding}'
+            response.set_etag(etag)
+        return response
+
+    def _make_streamed_response(self, output):
+        """Make a response that sends a StreamedOutput as it's written"""
+        chunks = iter(output)
+        # Wait for the first chunk, so that errors before there's any
+        # output (like failing data API calls) get a proper error response
+        first_chunk = next(chunks, '')
+        body = (
+            chunk.encode() for chunk in itertools.chain([first_chunk], chunks)
+        )
+        coding = request.accept_encodings.best_match(
+            ['gzip', 'identity'], default='identity',
+        )
+        if coding == 'gzip':
+            body = _gzip_stream(body)
+        response = self.flask_app.response_class(
+            body, content_type='text/html; charset=utf-8',
+        )
+        if coding != 'identity':
+            response.headers['Content-Encoding'] = coding
+        response.vary.add('Accept-Encoding')
+        response.headers['Age'] = '0'
+        return response
+
+    def _get_events(self, last_etag):
+        """Return server-sent events for /api/events
+
+        This is polling: the response ends right away, and browsers
+        reconnect after EVENT_POLL_INTERVAL with the last ID they got.
+        The event has the branches' summaries (see Branch.as_summary()),
+        and their ETag as the ID; it's only sent if they differ from the
+        last ones the client got.
+        """
+        events = f'retry: {EVENT_POLL_INTERVAL * 1000}\n\n'
+        rendering = self.cache.peek()
+        if (
+            rendering is not None
+            and rendering.branch_summaries_etag != last_etag
+        ):
+            # The summaries are JSON on a single line
+            events += (
+                'event: branches\n'
+                + f'id: {rendering.branch_summaries_etag}\n'
+                + f'data: {rendering.branch_summaries.decode()}\n\n'
+            )
+        return events
+
+    @defer.inlineCallbacks
+    def start(self, master):
+        """Regenerate the page on the master's mq events, not on a timer
+
+        Also index uploaded test results, now and then every
+        FAILURE_HISTORY_UPDATE_INTERVAL. Called (in the reactor thread)
+        by ReleaseDashboardService.
+        """
+        self._master = master
+        self._reactor = master.reactor
+        self._history_updates = task.LoopingCall(self._update_failure_history)
+        self._history_updates.clock = self._reactor
+        self._history_updates.start(FAILURE_HISTORY_UPDATE_INTERVAL)
+        try:
+            for event_filter in MQ_EVENT_FILTERS:
+                consumer = yield master.mq.startConsuming(
+                    self._on_mq_event, event_filter,
+                )
+                self._mq_consumers.append(consumer)
+        except Exception:
+            log.err(None, 'Release dashboard: could not subscribe to events')
+            self._stop_consuming()
+            return
+        self.cache.refresh_interval = EVENT_REFRESH_INTERVAL
+        self.cache.max_age = EVENT_REFRESH_INTERVAL + CACHE_DURATION
+
+    def _update_failure_history(self):
+        d = threads.deferToThread(self.failure_history.update)
+        # Log errors, and keep the LoopingCall going
+        d.addErrback(log.err, 'Release dashboard: could not index test results')
+        return d
+
+    def _on_mq_event(self, key, data):
+        if key[0] == 'builds':
+            d = self._update_streak(data)
+            self._streak_updates.add(d)
+            d.addBoth(lambda _: self._streak_updates.discard(d))
+        # Runs in the reactor thread, which mustn't wait for the cache's
+        # lock (threads that hold it can be busy loading a stored result):
+        # invalidate the cache from a pool thread, once per burst of events.
+        # DashboardState.refresh() finds out which builders were affected,
+        # and only recomputes those.
+        if self._event_call is None or not self._event_call.active():
+            self._event_call = self._reactor.callLater(
+                EVENT_DELAY, self._reactor.callInThread, self.cache.invalidate,
+            )
+
+    @defer.inlineCallbacks
+    def _update_streak(self, build_info):
+        """Bring the builder's failure Streak up to date with a new build
+
+        So renders don't need to. Builders that have no streak yet get one
+        when the page is rendered. Runs in the reactor thread; the table is
+        used in a pool thread.
+        """
+        try:
+            builderid = build_info["builderid"]
+            streak = yield threads.deferToThread(
+                self.failure_streaks.get, builderid,
+            )
+            if streak is None or streak.is_processed(build_info):
+                return
+            # Including builds we got no event for (e.g. during a reconfig)
+            infos = yield self._master.data.get(
+                ("builders", builderid, "builds"),
+                filters=[
+                    Filter("complete", "eq", ["True"]),
+                    Filter("complete_at", "ge", [streak.last_complete_at]),
+                ],
+            )
+            streak.advance(infos)
+            yield threads.deferToThread(self.failure_streaks.put, streak)
+        except Exception:
+            log.err(None, 'Release dashboard: could not update a streak')
+
+    def _stop_consuming(self):
+        for consumer in self._mq_consumers:
+            consumer.stopConsuming()
+        self._mq_consumers = []
+        if self._event_call is not None and self._event_call.active():
+            self._event_call.cancel()
+        self._event_call = None
+
+    @defer.inlineCallbacks
+    def stop(self):
+        """Stop the dashboard's background work, and close its databases
+
+        Called (in the reactor thread) by ReleaseDashboardService when
+        a reconfig replaces the dashboard, or the master shuts down.
+        The background work stops right away; the returned Deferred fires
+        once the work that was running is done and the databases are closed.
+        """
+        self._stop_consuming()
+        if self._history_updates is not None and self._history_updates.running:
+            self._history_updates.stop()
+        self.cache.stop()
+        yield defer.DeferredList(list(self._streak_updates))
+        yield threads.deferToThread(self.close)
+
+    def close(self):
+        """Close the dashboard's databases, once the running work is done
+
+        This waits for a page generation and failure history update that
+        are running: don't call it from the reactor.
+        """
+        self.cache.close()
+        self.failure_history.close()
+        self.junit_cache.close()
+        self.failure_streaks.close()
+
+    def _generate_page(self, environ, output):
+        # Runs in a background thread; templates need a request context
+        # (for url_for), so recreate the one we got.
+        with self.flask_app.request_context(environ):
+            return self.get_release_status(output)
+
+    @property
+    def branch_info(self):
+        # Release cycle info; refreshed in the background when it's old
+        return self.branch_info_provider.get()
+
+    def _get_junit_results(self, buildid):
+        # Look the build up separately from self.state, so we don't need
+        # to wait for a render to finish.
         state = DashboardState(self)
+        info = state.dataGet(("builds", buildid))
+        if info is None:
+            abort(404)
+        builder_info = state.dataGet(("builders", info["builderid"]))
+        if builder_info is None:
+            abort(404)
+        build = Build(Builder(state, builder_info), info)
+        if build.junit_results is None:
+            abort(404)
+        return build.junit_results
+
+    def get_release_status(self, output=None):
+        """Generate the dashboard; return a Rendering
+
+        The page's HTML is written to *output*, a StreamedOutput,
+        as it's rendered.
+        """
+        if output is None:
+            output = StreamedOutput()
+        metrics = RenderMetrics()
+        parsed_before = self.junit_cache.parse_stats()
+
+        # The state is shared between renders, and filled in lazily while
+        # rendering. Only one render at a time can use it.
+        with self._state_lock:
+            branch_sections = {}
+            stale_branches = []
+            with metrics.phase('refresh'):
+                if self.state is None:
+                    self.state = DashboardState(self, metrics)
+                else:
+                    self.state.metrics = metrics
+                    self.state.refresh()
+                state = self.state
+                # (For a new state, this is where builds are fetched)
+                for branch in state.branches:
+                    cached = self._get_cached_branch_section(branch)
+                    if cached is None:
+                        stale_branches.append(branch)
+                    else:
+                        branch_sections[branch.tag] = cached
+            with metrics.phase('problems'):
+                # All branches' problems go in the status
+                for branch in state.branches:
+                    branch.problems
+                # The template shows JUnit results and changes of
+                # stable builders' builds
+                shown_builds = [
+                    build
+                    for branch in stale_branches
+                    for build in branch.iter_affected_builds()
+                    if build.builder.is_stable
+                ]
+            with metrics.phase('junit'):
+                for build in shown_builds:
+                    build.junit_results
+                parsed_after = self.junit_cache.parse_stats()
+                metrics.count(
+                    'junit_files_parsed', parsed_after[0] - parsed_before[0],
+                )
+                metrics.count(
+                    'junit_bytes_parsed', parsed_after[1] - parsed_before[1],
+                )
+            with metrics.phase('changes'):
+                state.prefetch_changes(shown_builds)
+
+            with metrics.phase('status'):
+                status = json.dumps({
+                    'tiers': [tier.as_dict() for tier in state.tiers],
+                    'branches': [
+                        branch.as_dict() for branch in state.branches
+                    ],
+                }).encode()
+                status_etag = hashlib.sha256(status).hexdigest()
+                branch_summaries = json.dumps([
+                    branch.as_summary() for branch in state.branches
+                ]).encode()
+                # The page needs it, to ask for events after these
+                branch_summaries_etag = hashlib.sha256(
+                    branch_summaries,
+                ).hexdigest()
+            metrics.count('status_bytes', len(status))
+
+            def branch_section(branch):
+                # Stale sections are rendered when the page gets to them.
+                # That can take a while; let readers have what's ready.
+                output.flush()
+                if branch.tag not in branch_sections:
+                    with metrics.phase('render_sections'):
+                        branch_sections[branch.tag] = (
+                            self._render_branch_section(branch)
+                        )
+                    metrics.count('sections_rendered')
+                digest, rendered_at, html = branch_sections[branch.tag]
+                return html
+
+            with metrics.phase('render_page'):
+                for text in stream_template(
+                    "releasedashboard.html",
+                    state=state,
+                    Severity=Severity,
+                    generated_at=state.now,
+                    branch_summaries_etag=branch_summaries_etag,
+                    branch_section=branch_section,
+                ):
+                    output.write(text)
+            self._branch_sections = branch_sections
+            output.write(f'\n<!-- {metrics.summary()} -->\n')
+            html = output.getvalue()
+            metrics.count('html_bytes', len(html.encode()))
+            with metrics.phase('compress'):
+                html_encodings = _compress(html.encode())
+                status_encodings = _compress(status)
+            return Rendering(
+                html=html,
+                status=status,
+                status_etag=status_etag,
+                branch_summaries=branch_summaries,
+                branch_summaries_etag=branch_summaries_etag,
+                html_encodings=html_encodings,
+                status_encodings=status_encodings,
+                metrics=metrics,
+            )
+
+    def _get_cached_branch_section(self, branch):
+        """Get a _branch_sections entry if it's still good, or None"""
+        cached = self._branch_sections.get(branch.tag)
+        if cached is not None:
+            digest, rendered_at, html = cached
+            if (
+                digest == branch.digest
+                and time.monotonic() - rendered_at < FRAGMENT_MAX_AGE
+            ):
+                return cached
+        return None
 
-        return render_template(
-            "releasedashboard.html",
-            state=state,
+    def _render_branch_section(self, branch):
+        """Render a branch's section of the page
+
+        Return a (digest, rendered_at, html) entry for _branch_sections.
+        """
+        html = Markup(render_template(
+            "releasedashboard_branch.html",
+            branch=branch,
             Severity=Severity,
-            generated_at=state.now,
-        )
+            N_PROBLEM_BUILDS=N_PROBLEM_BUILDS,
+        ))
+        return branch.digest, time.monotonic(), html
+
 
-def get_release_status_app(buildernames=None, **kwargs):
-    return ReleaseDashboard(**kwargs).flask_app
+class ReleaseDashboardService(BuildbotService):
+    """Runs a ReleaseDashboard's work in the master: its mq subscriptions
+    and failure history updates
+
+    master.cfg creates a new dashboard on each reconfig. Buildbot keeps this
+    service across reconfigs, and hands it the new dashboard: it stops the
+    old one and starts the new one, and stops the last one when the master
+    shuts down. The reconfig doesn't wait for the old one's databases to
+    be closed (see ReleaseDashboard.stop()); the shutdown does.
+    """
+    name = 'release_dashboard'
+    dashboard = None
+
+    @defer.inlineCallbacks
+    def reconfigService(self, dashboard):
+        if self.dashboard is dashboard:
+            return
+        if self.dashboard is not None:
+            self.dashboard.stop().addErrback(
+                log.err, 'Release dashboard: could not stop the old dashboard',
+            )
+        self.dashboard = dashboard
+        yield dashboard.start(self.master)
+
+    @defer.inlineCallbacks
+    def stopService(self):
+        if self.dashboard is not None:
+            try:
+                yield self.dashboard.stop()
+            except Exception:
+                log.err(None, 'Release dashboard: could not stop the dashboard')
+        yield super().stopService()
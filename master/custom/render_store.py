@@ -0,0 +1,141 @@
+"""Stores for the release dashboard's generated page
+
+PageCache (see release_dashboard) keeps the last generated page in a store.
+MemoryRenderStore keeps it in the process. SQLiteRenderStore keeps it in
+a database file that several processes (web frontends, or masters sharing
+a disk) can use, so that the page is only generated once for all of them.
+
+A store also has a lease: PageCache only generates the page while it holds
+the lease; meanwhile, other processes wait for the result.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class MemoryRenderStore:
+    """Keeps the result in this process; the lease is always free"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entry = None
+
+    def load(self, since=None):
+        """Return (version, generated_at, result), or None
+
+        Return None if there's no result yet, or its version is *since*.
+        *generated_at* is the time.time() when the generation started.
+        """
+        with self._lock:
+            if self._entry is None or self._entry[0] == since:
+                return None
+            return self._entry
+
+    def save(self, generated_at, result):
+        """Store a result; return its version"""
+        with self._lock:
+            self._version += 1
+            self._entry = self._version, generated_at, result
+            return self._version
+
+    def acquire_lease(self, owner, duration):
+        """Get the lease for *duration* seconds, if it's free
+
+        Return true if *owner* (a unique string) got it.
+        """
+        return True
+
+    def release_lease(self, owner):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteRenderStore:
+    """Keeps the result in a SQLite database at *path*
+
+    Results are pickled: the database must only be writable by the
+    processes that use it.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        # Other processes' writes can take a while; wait for them
+        self._db = sqlite3.connect(
+            str(path), timeout=60, check_same_thread=False
+        )
+        with self._lock:
+            # Readers don't block the writer (and vice versa)
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS rendering (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL,
+                    generated_at REAL NOT NULL,
+                    result BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS lease (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+
+    def load(self, since=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, generated_at, result FROM rendering"
+                " WHERE version IS NOT ?",
+                (since,),
+            ).fetchone()
+        if row is None:
+            return None
+        version, generated_at, data = row
+        return version, generated_at, pickle.loads(data)
+
+    def save(self, generated_at, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._db:
+            self._db.execute(
+                """
+                INSERT INTO rendering VALUES (1, 1, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    version = version + 1,
+                    generated_at = excluded.generated_at,
+                    result = excluded.result
+                """,
+                (generated_at, data),
+            )
+            (version,) = self._db.execute(
+                "SELECT version FROM rendering"
+            ).fetchone()
+        return version
+
+    def acquire_lease(self, owner, duration):
+        now = time.time()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                """
+                INSERT INTO lease VALUES (1, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE lease.owner = excluded.owner OR lease.expires_at < ?
+                """,
+                (owner, now + duration, now),
+            )
+            return cursor.rowcount == 1
+
+    def release_lease(self, owner):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM lease WHERE owner = ?", (owner,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
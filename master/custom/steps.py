@@ -6,7 +6,7 @@ from buildbot.steps.shell import ShellCommand, Test as BaseTest
 from buildbot.steps.source.git import Git as _Git
 from buildbot.steps.source.github import GitHub as _GitHub
 
-from . import JUNIT_FILENAME
+from . import JUNIT_FILENAME, TEST_RESULT_DIR
 
 
 class Git(_Git):
@@ -195,7 +195,7 @@ class UploadTestResults(steps.FileUpload):
             doStepIf=self._want_xml_upload,
             workersrc=filename,
             masterdest=util.Interpolate(
-                f"/data/www/buildbot/test-results/{branch}/%(prop:buildername)s/build_%(prop:buildnumber)s.xml"
+                f"{TEST_RESULT_DIR}/{branch}/%(prop:buildername)s/build_%(prop:buildnumber)s.xml"
             ),
             mode=0o755,
         )
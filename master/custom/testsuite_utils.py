@@ -1,96 +1,409 @@
+import collections
+import hashlib
+import importlib
+import itertools
 import re
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from pathlib import Path
+from xml.etree import ElementTree
+
+from twisted.internet import defer, threads
+
+from buildbot.reporters.utils import getDetailsForBuild
+
+from custom import TEST_RESULT_DIR
+from custom.junit_utils import iter_junit_testcases
 
 TESTS_STEP = "test"
 
-TRACEBACK_REGEX = re.compile(
-    r"""
-     Traceback # Lines containing "Traceback"
-     [\s\S]+? # Match greedy any text (preserving ASCII flags).
-     (?=^(?:\d|test|\Z|\n|ok)) # Stop matching in lines starting with
-                               # a number (log time), "test" or the end
-                               # of the string.
-    """,
-    re.MULTILINE | re.VERBOSE,
+# Name of the master's cache of BuildAnalysis objects, by buildid
+# (its size is set in c["caches"])
+BUILD_ANALYSIS_CACHE = "BuildLogAnalyses"
+
+# Tracebacks are for humans (in PR comments, emails...), but a log can have
+# any number of them, of any size. Only the first MAX_TRACEBACKS different
+# ones are kept, and long ones are cut: in the middle if they have too many
+# lines, at the end of lines that are too long.
+MAX_TRACEBACKS = 20
+TRACEBACK_HEAD_LINES = 50
+TRACEBACK_TAIL_LINES = 50
+MAX_TRACEBACK_LINE_LENGTH = 1000
+
+# Logs that aren't in memory already are read from the data API,
+# LOG_CHUNK_LINES lines at a time
+LOG_CHUNK_LINES = 10_000
+# and logs that are, are split in lines TEXT_CHUNK_SIZE characters at a time
+TEXT_CHUNK_SIZE = 2**20
+# The test summary at the end of the log is kept as it's read. It's usually
+# short, but a verbose re-run can come in the middle; only the first
+# MAX_SUMMARY_LINES lines are kept then.
+MAX_SUMMARY_LINES = LOG_CHUNK_LINES
+
+# Refleak builders have this tag (see factories.UnixRefleakBuild)
+REFLEAK_TAG = "refleak"
+
+LEAKS_REGEX = re.compile(r"(test_\w+) leaked \[.*] (.*),.*")
+
+# "2 tests failed:" or "1 re-run test:", followed by lines of test names
+TEST_RESULTS_HEADER_REGEX = re.compile(
+    r"\d+\s(?:(?P<failed>tests?\sfailed)|(?P<rerun>re-run\stests?)):"
 )
 
-LEAKS_REGEX = re.compile(r"(test_\w+) leaked \[.*] (.*),.*", re.MULTILINE)
+# The first line of a failed test's report from unittest, like
+# "FAIL: test_unparse (test.test_tools.test_unparse.DirectoryTestCase)";
+# it comes after a line of "=", and is followed by a line of "-".
+FAILED_SUBTEST_REGEX = re.compile(r"[A-Z]+:\s(\w+)\s\((.*?)\)(.*)")
+
+
+@dataclass
+class LogAnalysis:
+    """What Logs finds in a regrtest log
+
+    Lists have no duplicates, and are in the order things appear in the log.
+    """
+    # At most MAX_TRACEBACKS, cut to size (see TracebackCollector)
+    tracebacks: list = field(default_factory=list)
+    # (test name, resource) pairs
+    leaks: list = field(default_factory=list)
+    # Tests listed after the last "N tests failed:" and "N re-run tests:"
+    failed_tests: list = field(default_factory=list)
+    rerun_tests: list = field(default_factory=list)
+    # (test name, subtest name) pairs
+    failed_subtests: list = field(default_factory=list)
+    summary: str = ""
+
+
+class LogAnalyzer:
+    """Find everything for a LogAnalysis in one pass over a log
+
+    Call feed_line() for each line of the log, then close().
+    The log is never kept whole; only the parts that end up in the result
+    (and the current traceback or list of tests) are.
+    """
+
+    def __init__(self):
+        self._tracebacks = TracebackCollector()
+        self._leaks = {}
+        self._failed_tests = []
+        self._rerun_tests = []
+        self._failed_subtests = {}
+        # True while reading a traceback
+        self._in_traceback = False
+        # Test names of the "N tests failed:" or "N re-run tests:" list
+        # being read, and which one it is ("failed" or "rerun")
+        self._test_list = None
+        self._test_list_name = None
+        # True if the previous line ended with "="
+        self._after_separator = False
+        # A failed subtest, if its report's "-" line is still to come
+        self._subtest = None
+        # The summary is from the last "== Tests result" to the last
+        # "Tests result:". Both are offsets in the log; the lines from
+        # the start are kept, up to MAX_SUMMARY_LINES of them.
+        self._summary_start = None
+        self._summary_end = None
+        self._summary_lines = None
+        # Offset of the current line in the log
+        self._offset = 0
+
+    def feed_line(self, line):
+        """Process a line of the log (without its newline)"""
+        first = line[:1]
+        self._feed_traceback(line, first)
+        self._feed_test_list(line, first)
+        self._feed_subtest(line)
+        self._feed_summary(line)
+        if " leaked [" in line:
+            match = LEAKS_REGEX.search(line)
+            if match:
+                self._leaks[match.groups()] = None
+        self._offset += len(line) + 1
+
+    def close(self, tail=""):
+        """Finish the analysis, and return the LogAnalysis
+
+        *tail* is the end of the log after its last newline, if any.
+        """
+        if tail:
+            # A last line with no newline after it: what it starts
+            # isn't terminated, so it's lost
+            self.feed_line(tail)
+        else:
+            # The end of the log terminates the current traceback
+            # and list of tests
+            self._end_traceback()
+            self._end_test_list()
+        self._in_traceback = False
+        self._test_list = self._subtest = None
+
+        summary = ""
+        if self._summary_lines is not None and self._summary_end is not None:
+            text = "\n".join(self._summary_lines)
+            summary = text[:max(0, self._summary_end - self._summary_start)]
+        return LogAnalysis(
+            tracebacks=self._tracebacks.get_tracebacks(),
+            leaks=list(self._leaks),
+            failed_tests=list(dict.fromkeys(self._failed_tests)),
+            rerun_tests=list(dict.fromkeys(self._rerun_tests)),
+            failed_subtests=list(self._failed_subtests),
+            summary=summary,
+        )
+
+    def _feed_traceback(self, line, first):
+        # A traceback starts at "Traceback" (anywhere in a line), and ends
+        # before the next line that's empty, or starts with a number
+        # (log time), "test" or "ok"
+        if self._in_traceback:
+            if not line or first.isdecimal() or line.startswith(("test", "ok")):
+                self._end_traceback()
+            else:
+                self._tracebacks.add_line(line)
+                return
+        if self._tracebacks.full:
+            return
+        start = line.find("Traceback")
+        if start >= 0:
+            self._in_traceback = True
+            self._tracebacks.start(line[start:])
+
+    def _end_traceback(self):
+        if self._in_traceback:
+            self._tracebacks.end()
+            self._in_traceback = False
+
+    def _feed_test_list(self, line, first):
+        # A list of tests ends before the next line that starts with
+        # a number, "test" or "Total"
+        if self._test_list is not None:
+            if first.isdecimal() or line.startswith(("test", "Total")):
+                self._end_test_list()
+            else:
+                self._test_list.extend(line.split())
+                return
+        if first.isdecimal():
+            match = TEST_RESULTS_HEADER_REGEX.match(line)
+            if match:
+                self._test_list = []
+                self._test_list_name = match.lastgroup
+
+    def _end_test_list(self):
+        if self._test_list is not None:
+            # Only the last list counts (e.g. after tests were re-run)
+            if self._test_list_name == "failed":
+                self._failed_tests = self._test_list
+            else:
+                self._rerun_tests = self._test_list
+            self._test_list = None
+
+    def _feed_subtest(self, line):
+        if self._subtest is not None:
+            # The report header is followed by a line with "-"
+            # (blank lines in between are OK)
+            if not line:
+                self._after_separator = False
+                return
+            if "-" in line:
+                self._failed_subtests[self._subtest] = None
+                self._subtest = None
+                self._after_separator = line.endswith("=")
+                return
+            self._subtest = None
+        if self._after_separator:
+            match = FAILED_SUBTEST_REGEX.match(line)
+            if match:
+                test, subtest, rest = match.groups()
+                if "-" in rest:
+                    self._failed_subtests[test, subtest] = None
+                else:
+                    self._subtest = test, subtest
+        self._after_separator = line.endswith("=")
+
+    def _feed_summary(self, line):
+        start = line.rfind("== Tests result")
+        if start >= 0:
+            self._summary_start = self._offset + start
+            self._summary_lines = [line[start:]]
+        elif (
+            self._summary_lines is not None
+            and len(self._summary_lines) < MAX_SUMMARY_LINES
+        ):
+            self._summary_lines.append(line)
+        end = line.rfind("Tests result:")
+        if end >= 0:
+            self._summary_end = self._offset + end
+
+
+class TracebackCollector:
+    """Collect different tracebacks, line by line, with bounded memory
+
+    Tracebacks are told apart by a hash of their full text, but only
+    the first TRACEBACK_HEAD_LINES and the last TRACEBACK_TAIL_LINES lines
+    of each are kept, each up to MAX_TRACEBACK_LINE_LENGTH characters.
+    Once there are MAX_TRACEBACKS, the collector is full.
+    """
+
+    def __init__(self):
+        # Hash of the full text -> text
+        self._tracebacks = {}
+        self._hash = None
+        self._head = []
+        self._tail = collections.deque(maxlen=TRACEBACK_TAIL_LINES)
+        self._line_count = 0
+
+    @property
+    def full(self):
+        return len(self._tracebacks) >= MAX_TRACEBACKS
+
+    def start(self, line):
+        self._hash = hashlib.sha256()
+        self._head = []
+        self._tail.clear()
+        self._line_count = 0
+        self.add_line(line)
+
+    def add_line(self, line):
+        self._hash.update(line.encode(errors="surrogatepass") + b"\n")
+        self._line_count += 1
+        if len(line) > MAX_TRACEBACK_LINE_LENGTH:
+            line = line[:MAX_TRACEBACK_LINE_LENGTH] + "..."
+        if len(self._head) < TRACEBACK_HEAD_LINES:
+            self._head.append(line)
+        else:
+            self._tail.append(line)
+
+    def end(self):
+        lines = self._head
+        omitted = self._line_count - len(self._head) - len(self._tail)
+        if omitted:
+            lines.append(f"... ({omitted} lines omitted) ...")
+        lines.extend(self._tail)
+        self._tracebacks.setdefault(
+            self._hash.digest(), "\n".join(lines) + "\n",
+        )
+        self._hash = None
+
+    def get_tracebacks(self):
+        return list(self._tracebacks.values())
+
+
+def iter_line_chunks(text):
+    """Split *text* in chunks of whole lines, of about TEXT_CHUNK_SIZE
+
+    Only the last chunk may not end with a newline.
+    """
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + TEXT_CHUNK_SIZE) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+
+def analyze_log(text):
+    """Return the LogAnalysis of a whole log"""
+    analyzer = LogAnalyzer()
+    tail = ""
+    for chunk in iter_line_chunks(text):
+        lines = chunk.split("\n")
+        tail = lines.pop()
+        for line in lines:
+            analyzer.feed_line(line)
+    return analyzer.close(tail)
+
+
+def analyze_junit(source):
+    """Return the LogAnalysis of a JUnit XML file written by regrtest
+
+    The file is parsed incrementally (see junit_utils). Tests that were
+    re-run only count as failed if their last run failed. Leaks and the
+    summary aren't in the file, so they're left empty (see
+    get_junit_logs_and_tracebacks_from_build).
+    """
+    tracebacks = TracebackCollector()
+    # Test case name -> None, for those whose last run failed
+    failed = {}
+    # Test cases that failed at some point (and regrtest names of those
+    # that were run again after that)
+    ever_failed = set()
+    rerun_tests = {}
+    for name, failure in iter_junit_testcases(source):
+        if name in ever_failed:
+            rerun_tests[_get_regrtest_name(name)] = None
+        if failure is None:
+            failed.pop(name, None)
+            continue
+        ever_failed.add(name)
+        failed[name] = None
+        text = failure["text"]
+        if text and text.strip() and not tracebacks.full:
+            lines = text.strip("\n").split("\n")
+            tracebacks.start(lines[0])
+            for line in lines[1:]:
+                tracebacks.add_line(line)
+            tracebacks.end()
+    return LogAnalysis(
+        tracebacks=tracebacks.get_tracebacks(),
+        failed_tests=list(dict.fromkeys(map(_get_regrtest_name, failed))),
+        rerun_tests=list(rerun_tests),
+        # Like LogAnalyzer finds them: ("test_x", "test.test_y.Tests")
+        failed_subtests=[_split_test_case(name) for name in failed],
+    )
+
+
+def _split_test_case(name):
+    cls, _, method = name.rpartition(".")
+    return method, cls
+
+
+def _get_regrtest_name(name):
+    """Get the name of the regrtest test that has a test case
+
+    For example, "test.test_asyncio.test_tasks.Tests.test_x" is in
+    "test_asyncio.test_tasks".
+    """
+    parts = name.split(".")
+    if parts[0] == "test":
+        parts.pop(0)
+    module = itertools.takewhile(lambda part: part.startswith("test_"), parts)
+    return ".".join(module) or name
 
 
 class Logs:
     def __init__(self, raw_logs):
         self._logs = raw_logs
 
+    @classmethod
+    def from_analysis(cls, analysis):
+        """Make Logs from a LogAnalysis; their raw_logs is None"""
+        logs = cls(None)
+        logs.analysis = analysis
+        return logs
+
     @property
     def raw_logs(self):
         return self._logs
 
-    def _get_test_results(self, header):
-        test_regexp = re.compile(
-            rf"""
-             ^\d+\s{header}: # Lines starting with "header"
-             [\s\S]+? # Match greedy any text (preserving ASCII flags).
-             (?=^(?:\d|test|\Z|Total)) # Stop matching in lines starting with
-                                       # a number (log time), "test" or the end
-                                       # of the string.
-            """,
-            re.MULTILINE | re.VERBOSE,
-        )
-
-        failed_blocks = list(set(test_regexp.findall(self._logs)))
-        if not failed_blocks:
-            return set()
-        # Pick the last re-run of the test
-        block = failed_blocks[-1]
-        tests = []
-        for line in block.split("\n")[1:]:
-            if not line:
-                continue
-            test_names = line.split(" ")
-            tests.extend(test for test in test_names if test)
-        return set(tests)
+    @cached_property
+    def analysis(self):
+        return analyze_log(self._logs)
 
     def get_tracebacks(self):
-        yield from set(TRACEBACK_REGEX.findall(self._logs))
+        yield from self.analysis.tracebacks
 
     def get_leaks(self):
-        for test_name, resource in set(LEAKS_REGEX.findall(self._logs)):
-            yield test_name, resource
+        yield from self.analysis.leaks
 
     def get_failed_tests(self):
-        yield from set(self._get_test_results(r"tests?\sfailed"))
+        yield from self.analysis.failed_tests
 
     def get_rerun_tests(self):
-        yield from set(self._get_test_results(r"re-run\stests?"))
+        yield from self.analysis.rerun_tests
 
     def get_failed_subtests(self):
-        failed_subtest_regexp = re.compile(
-            r"=+"  # Decoration prefix
-            r"\n[A-Z]+:"  # Test result (e.g. FAIL:)
-            r"\s(\w+)\s"  # test name (e.g. test_tools)
-            r"\((.*?)\)"  # subtest name (e.g. test.test_tools.test_unparse.DirectoryTestCase)
-            r".*"  # Trailing text (e.g. filename)
-            r"\n*"  # End of the line
-            r".*"  # Maybe some test description
-            r"-+",  # Trailing decoration
-            re.MULTILINE | re.VERBOSE,
-        )
-        for test, subtest in set(failed_subtest_regexp.findall(self._logs)):
-            yield test, subtest
+        yield from self.analysis.failed_subtests
 
     def test_summary(self):
-        result_start = [
-            match.start() for match in re.finditer("== Tests result", self._logs)
-        ]
-        if not result_start:
-            return ""
-        result_start = result_start[-1]
-        result_end = [
-            match.start() for match in re.finditer("Tests result:", self._logs)
-        ]
-        if not result_end:
-            return ""
-        result_end = result_end[-1]
-        return self._logs[result_start:result_end]
+        return self.analysis.summary
 
     def format_failing_tests(self):
 
@@ -115,30 +428,278 @@ class Logs:
         return "\n".join(text)
 
 
+class StdioLogAnalyzer:
+    """Analyze a Buildbot stdio log, given in chunks of its content
+
+    Each line of the content starts with its stream ("o" for stdout,
+    "e" for stderr...); that's stripped before the line is analyzed.
+    Call feed() with chunks of whole lines, then close().
+    """
+
+    def __init__(self):
+        self._analyzer = LogAnalyzer()
+        # The last line is held back: it goes to LogAnalyzer.close()
+        self._last_line = None
+
+    def feed(self, content):
+        for chunk in iter_line_chunks(content):
+            for line in chunk.splitlines():
+                if self._last_line is not None:
+                    self._analyzer.feed_line(self._last_line)
+                self._last_line = line.lstrip("eo")
+
+    def close(self):
+        """Return the LogAnalysis"""
+        return self._analyzer.close(self._last_line or "")
+
+
+class StderrCollector:
+    """Collect the stderr lines of a Buildbot stdio log, given in chunks"""
+
+    def __init__(self):
+        self._lines = []
+
+    def feed(self, content):
+        for chunk in iter_line_chunks(content):
+            self._lines.extend(
+                line.lstrip("e") for line in chunk.splitlines() if line.startswith("e")
+            )
+
+    def get_text(self):
+        return "\n".join(self._lines)
+
+
 def construct_tracebacks_from_build_stderr(build):
     for step in build["steps"]:
         try:
             test_log = step["logs"][0]["content"]["content"]
         except IndexError:
             continue
-        test_log = "\n".join(
-            [line.lstrip("e") for line in test_log.splitlines() if line.startswith("e")]
-        )
+        stderr = StderrCollector()
+        stderr.feed(test_log)
+        test_log = stderr.get_text()
         if not test_log:
             continue
         yield test_log
 
 
 def get_logs_and_tracebacks_from_build(build):
-    test_log = ""
+    """Return the Logs of *build*'s test step, and its tracebacks
+
+    *build* must have the content of its logs. If the test log has no
+    tracebacks, the stderr of each step is returned instead.
+    """
+    analyzer = StdioLogAnalyzer()
     try:
         test_step = [step for step in build["steps"] if step["name"] == TESTS_STEP][0]
-        test_log = test_step["logs"][0]["content"]["content"]
-        test_log = "\n".join([line.lstrip("eo") for line in test_log.splitlines()])
+        analyzer.feed(test_step["logs"][0]["content"]["content"])
     except IndexError:
         pass
-    logs = Logs(test_log)
+    logs = Logs.from_analysis(analyzer.close())
     tracebacks = list(logs.get_tracebacks())
     if not tracebacks:
         tracebacks = list(construct_tracebacks_from_build_stderr(build))
     return logs, tracebacks
+
+
+@defer.inlineCallbacks
+def stream_logs_and_tracebacks_from_build(master, build):
+    """Like get_logs_and_tracebacks_from_build, reading the logs in chunks
+
+    *build* must have its steps and their logs, but not their content:
+    the logs are read from the data API, LOG_CHUNK_LINES lines at a time,
+    and analyzed in a thread as they come. Only the analysis is kept
+    (and the stderr lines, if there are no tracebacks).
+    """
+    analyzer = StdioLogAnalyzer()
+    test_log = _get_test_log(build)
+    if test_log is not None:
+        yield read_log(master, test_log, analyzer.feed)
+    logs = Logs.from_analysis(analyzer.close())
+    tracebacks = list(logs.get_tracebacks())
+    if not tracebacks:
+        tracebacks = yield _get_stderr_tracebacks(master, build)
+    return logs, tracebacks
+
+
+def get_junit_file(build, test_result_dir=TEST_RESULT_DIR):
+    """Return the Path of the JUnit XML file *build* uploaded, or None
+
+    UploadTestResults puts it in a directory named after the branch, which
+    is one of the builder's tags. A file older than the build is from
+    another build with the same number; it's ignored.
+    """
+    builder = build.get("builder")
+    if not builder:
+        return None
+    root = Path(test_result_dir).resolve()
+    for tag in builder.get("tags") or ():
+        path = (root / tag / builder["name"] / f"build_{build['number']}.xml").resolve()
+        # Ensure path doesn't escape test_result_dir
+        if not path.is_relative_to(root):
+            continue
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        started_at = build.get("started_at")
+        if started_at is not None and mtime < started_at.timestamp():
+            continue
+        return path
+    return None
+
+
+def get_junit_analysis(build):
+    """Return the LogAnalysis of *build*'s JUnit XML file (see analyze_junit)
+
+    Return None if there's no file, it's not valid XML, or it has no failed
+    tests: then what failed isn't in it (a crash, a timeout, leaks...).
+    """
+    path = get_junit_file(build)
+    if path is None:
+        return None
+    try:
+        with path.open("rb") as file:
+            analysis = analyze_junit(file)
+    except (OSError, ElementTree.ParseError):
+        return None
+    if not analysis.failed_tests:
+        return None
+    return analysis
+
+
+@defer.inlineCallbacks
+def get_junit_logs_and_tracebacks_from_build(master, build, analysis):
+    """Like get_logs_and_tracebacks_from_build, for a JUnit XML LogAnalysis
+
+    The test log is only read for its summary, in its last
+    LOG_CHUNK_LINES lines, and for the stderr if there are no tracebacks.
+    On refleak builders, it's read whole for the leaks, which regrtest
+    reports as it goes. *build* must have its steps and their logs.
+    """
+    analyzer = StdioLogAnalyzer()
+    test_log = _get_test_log(build)
+    if test_log is not None:
+        tags = (build.get("builder") or {}).get("tags") or ()
+        last_lines = None if REFLEAK_TAG in tags else LOG_CHUNK_LINES
+        yield read_log(master, test_log, analyzer.feed, last_lines=last_lines)
+    log_analysis = analyzer.close()
+    logs = Logs.from_analysis(
+        replace(analysis, summary=log_analysis.summary, leaks=log_analysis.leaks)
+    )
+    tracebacks = list(logs.get_tracebacks())
+    if not tracebacks:
+        tracebacks = yield _get_stderr_tracebacks(master, build)
+    return logs, tracebacks
+
+
+def _get_test_log(build):
+    """Return the data API dict of the test step's log, or None"""
+    for step in build["steps"]:
+        if step["name"] == TESTS_STEP:
+            return step["logs"][0] if step["logs"] else None
+    return None
+
+
+@defer.inlineCallbacks
+def _get_stderr_tracebacks(master, build):
+    # Like construct_tracebacks_from_build_stderr
+    if _has_logs_content(build):
+        tracebacks = yield threads.deferToThread(
+            lambda: list(construct_tracebacks_from_build_stderr(build))
+        )
+        return tracebacks
+    tracebacks = []
+    for step in build["steps"]:
+        if not step["logs"]:
+            continue
+        stderr = StderrCollector()
+        yield read_log(master, step["logs"][0], stderr.feed)
+        text = stderr.get_text()
+        if text:
+            tracebacks.append(text)
+    return tracebacks
+
+
+@defer.inlineCallbacks
+def read_log(master, log, feed, last_lines=None):
+    """Read a log from the data API in chunks of LOG_CHUNK_LINES lines
+
+    *log* is its data API dict. feed(content) is called in a thread for
+    each chunk, one at a time. If *last_lines* is given, only that many
+    lines at the end of the log are read.
+    """
+    start = 0
+    if last_lines is not None:
+        start = max(0, log["num_lines"] - last_lines)
+    for offset in range(start, log["num_lines"], LOG_CHUNK_LINES):
+        chunk = yield master.data.get(
+            ("logs", log["logid"], "contents"), offset=offset, limit=LOG_CHUNK_LINES
+        )
+        if chunk is None:
+            break
+        yield threads.deferToThread(feed, chunk["content"])
+
+
+class BuildAnalysis:
+    """A build's analyzed test log (Logs) and its tracebacks
+
+    (Not a tuple: Buildbot's caches keep weak references to their values.)
+    """
+
+    def __init__(self, logs, tracebacks):
+        self.logs = logs
+        self.tracebacks = tracebacks
+
+
+def get_build_analysis(master, build):
+    """Return a Deferred BuildAnalysis of *build*
+
+    All reporters of a failed build want it, so it's kept in the master's
+    BUILD_ANALYSIS_CACHE. The first reporter that asks reads the logs in
+    chunks and analyzes them (in a thread); reporters that ask meanwhile
+    wait for that. If *build* already has the content of its logs (from
+    getDetailsForBuild(..., want_logs_content=True)), that is used.
+    If the build uploaded a JUnit XML file with failed tests, that is
+    analyzed instead of the test log (see get_junit_analysis).
+    """
+    cache = master.caches.get_cache(BUILD_ANALYSIS_CACHE, _analyze_build_miss)
+    return cache.get(build["buildid"], master=master, build=build)
+
+
+def _analyze_build_miss(buildid, master, build):
+    # The master's cache lives as long as the master, and keeps the miss
+    # function it was created with; master.cfg reloads this module on
+    # reconfig, so look up the current _analyze_build.
+    module = importlib.import_module(__name__)
+    return module._analyze_build(buildid, master, build)
+
+
+@defer.inlineCallbacks
+def _analyze_build(buildid, master, build):
+    if not _has_logs_content(build):
+        # Don't add the steps to the reporter's build: they would be
+        # kept as long as it is
+        build = dict(build)
+        yield getDetailsForBuild(master, build, want_logs=True, want_steps=True)
+    # The JUnit XML file is more exact, and much smaller than the log
+    analysis = yield threads.deferToThread(get_junit_analysis, build)
+    if analysis is not None:
+        logs, tracebacks = yield get_junit_logs_and_tracebacks_from_build(
+            master, build, analysis
+        )
+    elif _has_logs_content(build):
+        logs, tracebacks = yield threads.deferToThread(
+            get_logs_and_tracebacks_from_build, build
+        )
+    else:
+        logs, tracebacks = yield stream_logs_and_tracebacks_from_build(master, build)
+    return BuildAnalysis(logs, tracebacks)
+
+
+def _has_logs_content(build):
+    if "steps" not in build:
+        return False
+    return all(
+        "content" in log for step in build["steps"] for log in step.get("logs", ())
+    )
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Make the master's custom package importable, like master.cfg does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,98 @@
+"""Tests of the bounds on tracebacks found in regrtest logs
+
+Timings are left to benchmarks/regrtest_logs.py; these only check that
+the tracebacks are capped, on the same kinds of adversarial logs.
+"""
+
+from custom.testsuite_utils import (
+    MAX_TRACEBACK_LINE_LENGTH,
+    MAX_TRACEBACKS,
+    TRACEBACK_HEAD_LINES,
+    TRACEBACK_TAIL_LINES,
+    Logs,
+)
+
+
+def get_tracebacks(text):
+    return list(Logs(text).get_tracebacks())
+
+
+def test_traceback_storm():
+    # Every line starts a traceback; nothing ends one
+    text = "\n".join(
+        f"Traceback (most recent call last): {i}" for i in range(10_000)
+    )
+    tracebacks = get_tracebacks(text)
+    assert len(tracebacks) <= MAX_TRACEBACKS
+    for traceback in tracebacks:
+        assert traceback.count("\n") <= (
+            TRACEBACK_HEAD_LINES + TRACEBACK_TAIL_LINES + 1
+        )
+
+
+def test_many_tracebacks():
+    text = "".join(
+        "Traceback (most recent call last):\n"
+        f'  File "test_{i}.py", line {i}, in test_{i}\n'
+        f"AssertionError: {i}\n"
+        "\n"
+        for i in range(10 * MAX_TRACEBACKS)
+    )
+    tracebacks = get_tracebacks(text)
+    assert len(tracebacks) == MAX_TRACEBACKS
+    # The first ones are kept
+    assert tracebacks[0] == (
+        "Traceback (most recent call last):\n"
+        '  File "test_0.py", line 0, in test_0\n'
+        "AssertionError: 0\n"
+    )
+
+
+def test_same_traceback_is_kept_once():
+    traceback = (
+        "Traceback (most recent call last):\n"
+        '  File "test_x.py", line 1, in test_x\n'
+        "AssertionError\n"
+    )
+    assert get_tracebacks((traceback + "\n") * 100) == [traceback]
+
+
+def test_huge_traceback():
+    n_lines = 10 * (TRACEBACK_HEAD_LINES + TRACEBACK_TAIL_LINES)
+    frames = [f'  File "recursive.py", line {i}, in f' for i in range(n_lines)]
+    text = "\n".join(
+        [
+            "Traceback (most recent call last):",
+            *frames,
+            "RecursionError: maximum recursion depth exceeded",
+            "",
+        ]
+    )
+    [traceback] = get_tracebacks(text)
+    lines = traceback.splitlines()
+    omitted = n_lines + 2 - TRACEBACK_HEAD_LINES - TRACEBACK_TAIL_LINES
+    assert lines == [
+        "Traceback (most recent call last):",
+        *frames[: TRACEBACK_HEAD_LINES - 1],
+        f"... ({omitted} lines omitted) ...",
+        *frames[-TRACEBACK_TAIL_LINES + 1 :],
+        "RecursionError: maximum recursion depth exceeded",
+    ]
+
+
+def test_huge_line():
+    text = "Traceback: " + "x" * 1_000_000 + "\n\n"
+    [traceback] = get_tracebacks(text)
+    line = ("Traceback: " + "x" * 1_000_000)[:MAX_TRACEBACK_LINE_LENGTH]
+    assert traceback == line + "...\n"
+
+
+def test_different_huge_tracebacks_are_told_apart():
+    # They only differ after what's kept of them
+    prefix = "Traceback: " + "x" * MAX_TRACEBACK_LINE_LENGTH
+    text = "".join(f"{prefix}{i}\n\n" for i in range(2))
+    tracebacks = get_tracebacks(text)
+    assert len(tracebacks) == 2
+    assert tracebacks[0] == tracebacks[1] == (
+        prefix[:MAX_TRACEBACK_LINE_LENGTH] + "...\n"
+    )